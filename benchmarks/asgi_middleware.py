@@ -0,0 +1,103 @@
+"""Measures the latency added by the middlewares when serving ASGI requests.
+
+Requests go through Django's full async handler (via AsyncClient) with
+three middleware configurations:
+
+* no django_prometheus middleware, as a baseline;
+* middlewares that let MiddlewareMixin adapt their hooks with
+  sync_to_async, which is how they used to run under ASGI;
+* the current middlewares, whose hooks run on the event loop.
+
+Usage:
+  PYTHONPATH=. python benchmarks/asgi_middleware.py [--requests N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import timeit
+
+import django
+from django.conf import settings
+
+settings.configure(ALLOWED_HOSTS=["*"], ROOT_URLCONF=__name__, USE_TZ=True)
+django.setup()
+
+from django.http import HttpResponse  # noqa: E402
+from django.test import AsyncClient, override_settings  # noqa: E402
+from django.urls import path  # noqa: E402
+from django.utils.deprecation import MiddlewareMixin  # noqa: E402
+
+from django_prometheus.middleware import (  # noqa: E402
+    PrometheusAfterMiddleware,
+    PrometheusBeforeMiddleware,
+)
+
+
+async def view(request):
+    return HttpResponse("OK")
+
+
+urlpatterns = [path("bench", view, name="bench")]
+
+
+class ThreadedBeforeMiddleware(PrometheusBeforeMiddleware):
+    __acall__ = MiddlewareMixin.__acall__
+
+
+class ThreadedAfterMiddleware(PrometheusAfterMiddleware):
+    __acall__ = MiddlewareMixin.__acall__
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Let Django adapt the synchronous hooks.
+        vars(self).pop("process_view", None)
+        vars(self).pop("process_template_response", None)
+
+
+CONFIGURATIONS = {
+    "no middleware": [],
+    "sync_to_async hooks": [
+        f"{__name__}.ThreadedBeforeMiddleware",
+        f"{__name__}.ThreadedAfterMiddleware",
+    ],
+    "event loop hooks": [
+        "django_prometheus.middleware.PrometheusBeforeMiddleware",
+        "django_prometheus.middleware.PrometheusAfterMiddleware",
+    ],
+}
+
+
+async def measure(requests):
+    client = AsyncClient()
+    await client.get("/bench")  # Warm up, loads the middleware chain.
+    latencies = []
+    for _ in range(requests):
+        start = timeit.default_timer()
+        await client.get("/bench")
+        latencies.append(timeit.default_timer() - start)
+    return latencies
+
+
+def percentiles(latencies):
+    quantiles = statistics.quantiles(latencies, n=100)
+    return quantiles[49] * 1e6, quantiles[98] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    results = {}
+    for name, middleware in CONFIGURATIONS.items():
+        with override_settings(MIDDLEWARE=middleware):
+            results[name] = percentiles(asyncio.run(measure(args.requests)))
+    base_p50, base_p99 = results["no middleware"]
+    for name, (p50, p99) in results.items():
+        print(
+            f"{name:20s} p50 {p50:8.1f} us (+{p50 - base_p50:6.1f})   p99 {p99:8.1f} us (+{p99 - base_p99:6.1f})",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measures the overhead of the instrumented database backends.
+
+Creates cursors and runs a trivial query on an in-memory SQLite
+database, through Django's sqlite3 backend and through
+django_prometheus's, with and without the memoization of the generated
+CursorWrapper classes.
+
+Usage:
+  PYTHONPATH=. python benchmarks/cursors.py [--cursors N]
+"""
+
+import argparse
+import timeit
+
+import django
+from django.conf import settings
+
+settings.configure(
+    DATABASES={
+        "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+        "instrumented": {"ENGINE": "django_prometheus.db.backends.sqlite3", "NAME": ":memory:"},
+    },
+)
+django.setup()
+
+from django.db import connections  # noqa: E402
+
+from django_prometheus.db import common  # noqa: E402
+
+
+def create_cursor(alias):
+    cursor = connections[alias].cursor()
+    cursor.execute("SELECT 1")
+    cursor.close()
+
+
+def measure(alias, cursors):
+    create_cursor(alias)  # Warm up, opens the connection.
+    return min(timeit.repeat(lambda: create_cursor(alias), number=cursors, repeat=5)) / cursors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cursors", type=int, default=20000)
+    args = parser.parse_args()
+    results = {
+        "django": measure("default", args.cursors),
+        "memoized classes": measure("instrumented", args.cursors),
+    }
+    memoized = common.ExportingCursorWrapper
+    common.ExportingCursorWrapper = common._MakeExportingCursorWrapper
+    try:
+        results["class per cursor"] = measure("instrumented", args.cursors)
+    finally:
+        common.ExportingCursorWrapper = memoized
+    base = results["django"]
+    for name, duration in results.items():
+        print(f"{name:20s} {duration * 1e6:8.2f} us per cursor (+{(duration - base) * 1e6:6.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measures the per-request overhead of PrometheusAfterMiddleware.
+
+Compares the current middleware with one that resolves labelled
+children by calling metric.labels() for every metric on every request,
+which is what the middleware did before children were cached.
+
+Usage:
+  PYTHONPATH=. python benchmarks/middleware.py [--requests N]
+"""
+
+import argparse
+import timeit
+
+import django
+from django.conf import settings
+
+settings.configure(ALLOWED_HOSTS=["*"], ROOT_URLCONF=[], USE_TZ=True)
+django.setup()
+
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.urls import ResolverMatch  # noqa: E402
+
+from django_prometheus.middleware import PrometheusAfterMiddleware  # noqa: E402
+
+
+def view(request):
+    return HttpResponse("OK")
+
+
+class UncachedAfterMiddleware(PrometheusAfterMiddleware):
+    def label_metric(self, metric, request, response=None, **labels):
+        return metric.labels(**labels) if labels else metric
+
+
+def one_request(middleware, request, response):
+    middleware.process_request(request)
+    middleware.process_view(request, view)
+    middleware.process_response(request, response)
+
+
+def bench(middleware_cls, requests):
+    middleware = middleware_cls(lambda request: None)
+    request = RequestFactory().get("/bench")
+    request.resolver_match = ResolverMatch(view, (), {}, url_name="bench")
+    response = HttpResponse("OK")
+    one_request(middleware, request, response)  # Warm up.
+    best = min(timeit.repeat(lambda: one_request(middleware, request, response), number=requests, repeat=5))
+    return best / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    before = bench(UncachedAfterMiddleware, args.requests)
+    after = bench(PrometheusAfterMiddleware, args.requests)
+    print(f"metric.labels() per request: {before:.2f} us/request")
+    print(f"cached label children:       {after:.2f} us/request")
+    print(f"saved:                       {before - after:.2f} us/request ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
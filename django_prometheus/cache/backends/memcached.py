@@ -1,27 +1,15 @@
 from django.core.cache.backends import memcached
 
-from django_prometheus.cache.metrics import (
-    django_cache_get_total,
-    django_cache_hits_total,
-    django_cache_misses_total,
-)
+from django_prometheus.cache.common import CacheMetricsMixin
 
 
-class MemcachedPrometheusCacheMixin:
-    def get(self, key, default=None, version=None):
-        django_cache_get_total.labels(backend="memcached").inc()
-        cached = super().get(key, default=None, version=version)
-        if cached is not None:
-            django_cache_hits_total.labels(backend="memcached").inc()
-            return cached
-
-        django_cache_misses_total.labels(backend="memcached").inc()
-        return default
+class MemcachedPrometheusCacheMixin(CacheMetricsMixin):
+    prometheus_backend = "memcached"
 
 
 class PyLibMCCache(MemcachedPrometheusCacheMixin, memcached.PyLibMCCache):
-    """Inherit memcached to add metrics about hit/miss ratio"""
+    """Inherit memcached to add metrics about its operations and hit/miss ratio"""
 
 
 class PyMemcacheCache(MemcachedPrometheusCacheMixin, memcached.PyMemcacheCache):
-    """Inherit memcached to add metrics about hit/miss ratio"""
+    """Inherit memcached to add metrics about its operations and hit/miss ratio"""
@@ -1,22 +1,24 @@
 from django.core.cache.backends.redis import RedisCache as DjangoRedisCache
 from django_redis import cache, exceptions
 
+from django_prometheus.cache.common import CacheMetricsMixin
 from django_prometheus.cache.metrics import (
     django_cache_get_fail_total,
     django_cache_get_total,
-    django_cache_hits_total,
-    django_cache_misses_total,
 )
 
 
-class RedisCache(cache.RedisCache):
-    """Inherit redis to add metrics about hit/miss/interruption ratio"""
+class RedisCache(CacheMetricsMixin, cache.RedisCache):
+    """Inherit redis to add metrics about its operations and hit/miss/interruption ratio"""
+
+    prometheus_backend = "redis"
 
     @cache.omit_exception
     def get(self, key, default=None, version=None, client=None):
+        self._prometheus_observe_keys((key,))
         try:
             django_cache_get_total.labels(backend="redis").inc()
-            cached = self.client.get(key, default=None, version=version, client=client)
+            cached = self._prometheus_call("get", self.client.get, key, default=None, version=version, client=client)
         except exceptions.ConnectionInterrupted as e:
             django_cache_get_fail_total.labels(backend="redis").inc()
             if self._ignore_exceptions:
@@ -25,23 +27,9 @@ class RedisCache(cache.RedisCache):
                 return default
             raise
         else:
-            if cached is not None:
-                django_cache_hits_total.labels(backend="redis").inc()
-                return cached
-            django_cache_misses_total.labels(backend="redis").inc()
-            return default
+            self._prometheus_observe_get(cached)
+            return default if cached is None else cached
 
 
-class NativeRedisCache(DjangoRedisCache):
-    def get(self, key, default=None, version=None):
-        django_cache_get_total.labels(backend="native_redis").inc()
-        try:
-            result = super().get(key, default=None, version=version)
-        except Exception:
-            django_cache_get_fail_total.labels(backend="native_redis").inc()
-            raise
-        if result is not None:
-            django_cache_hits_total.labels(backend="native_redis").inc()
-            return result
-        django_cache_misses_total.labels(backend="native_redis").inc()
-        return default
+class NativeRedisCache(CacheMetricsMixin, DjangoRedisCache):
+    prometheus_backend = "native_redis"
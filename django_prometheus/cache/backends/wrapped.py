@@ -0,0 +1,136 @@
+"""A cache backend that instruments any other backend.
+
+The backend to instrument is set by the BACKEND option, e.g.:
+
+    CACHES = {
+        "default": {
+            "BACKEND": "django_prometheus.cache.backends.wrapped.InstrumentedCache",
+            "LOCATION": "my_cache_table",
+            "OPTIONS": {"BACKEND": "django.core.cache.backends.db.DatabaseCache"},
+        },
+    }
+
+Its metrics are labelled by the alias of the cache, "default" here,
+rather than by the type of the backend, so that caches of the same type
+can be told apart. The label can also be set by the ALIAS option, which
+is required if several caches share the same OPTIONS dictionary.
+"""
+
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.backends.base import BaseCache
+from django.utils.module_loading import import_string
+
+from django_prometheus.cache.common import CacheMetricsMixin, ObserveValueSizes
+from django_prometheus.conf import PROMETHEUS_CACHE_VALUE_SIZES
+
+WRAPPED_BACKEND_OPTION = "BACKEND"
+ALIAS_OPTION = "ALIAS"
+
+
+class CacheProxy(BaseCache):
+    """Delegates to cache, a cache backend of any class.
+
+    BaseCache's get_or_set is not delegated, so that the get and add it
+    calls go through the proxy.
+    """
+
+    def __init__(self, cache):
+        # BaseCache.__init__ isn't called: the settings are the cache's.
+        self.cache = cache
+
+    def __getattr__(self, attr):
+        if attr == "cache":
+            raise AttributeError(attr)
+        return getattr(self.cache, attr)
+
+    def make_key(self, *args, **kwargs):
+        return self.cache.make_key(*args, **kwargs)
+
+    def validate_key(self, *args, **kwargs):
+        return self.cache.validate_key(*args, **kwargs)
+
+    def make_and_validate_key(self, *args, **kwargs):
+        return self.cache.make_and_validate_key(*args, **kwargs)
+
+    def get_backend_timeout(self, *args, **kwargs):
+        return self.cache.get_backend_timeout(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self.cache.get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self.cache.set(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self.cache.add(*args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self.cache.touch(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.cache.delete(*args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self.cache.has_key(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self.cache.incr(*args, **kwargs)
+
+    def decr(self, *args, **kwargs):
+        return self.cache.decr(*args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self.cache.get_many(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self.cache.set_many(*args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self.cache.delete_many(*args, **kwargs)
+
+    def incr_version(self, *args, **kwargs):
+        return self.cache.incr_version(*args, **kwargs)
+
+    def decr_version(self, *args, **kwargs):
+        return self.cache.decr_version(*args, **kwargs)
+
+    def clear(self):
+        return self.cache.clear()
+
+    def close(self, **kwargs):
+        return self.cache.close(**kwargs)
+
+
+def _FindAlias(options):
+    """Returns the alias of the cache configured with options, or None.
+
+    Backends are not told their alias, but the cache handler gives them
+    a shallow copy of their settings, so their options can be found.
+    """
+    if ALIAS_OPTION in options:
+        return options[ALIAS_OPTION]
+    aliases = [alias for alias, config in caches.settings.items() if config.get("OPTIONS") is options]
+    if len(aliases) > 1:
+        raise InvalidCacheBackendError(
+            f"The caches {', '.join(aliases)} share their OPTIONS, the {ALIAS_OPTION} option must be set to tell "
+            "them apart."
+        )
+    return aliases[0] if aliases else None
+
+
+class InstrumentedCache(CacheMetricsMixin, CacheProxy):
+    """Instruments the cache backend set by OPTIONS["BACKEND"]."""
+
+    def __init__(self, location, params):
+        options = params.get("OPTIONS") or {}
+        backend = options.get(WRAPPED_BACKEND_OPTION)
+        if not backend:
+            raise InvalidCacheBackendError(
+                f"The {WRAPPED_BACKEND_OPTION} option must be set to the cache backend to instrument."
+            )
+        self.prometheus_backend = _FindAlias(options) or backend
+        # Some backends pass their options on to their client.
+        options = {key: value for key, value in options.items() if key not in (WRAPPED_BACKEND_OPTION, ALIAS_OPTION)}
+        super().__init__(import_string(backend)(location, {**params, "OPTIONS": options}))
+        if PROMETHEUS_CACHE_VALUE_SIZES:
+            ObserveValueSizes(self.cache, self.prometheus_backend)
@@ -0,0 +1,268 @@
+from contextvars import ContextVar
+
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+from django.utils.module_loading import import_string
+
+from django_prometheus.cache import metrics
+from django_prometheus.cache.metrics import (
+    django_cache_batch_size,
+    django_cache_get_fail_total,
+    django_cache_get_total,
+    django_cache_get_value_size_bytes,
+    django_cache_hits_total,
+    django_cache_misses_total,
+    django_cache_operation_duration_seconds,
+    django_cache_operation_errors_total,
+    django_cache_operations_total,
+    django_cache_set_value_size_bytes,
+)
+from django_prometheus.conf import PROMETHEUS_CACHE_VALUE_SIZES
+from django_prometheus.utils import Time, TimeSince
+
+try:
+    from django_redis.cache import RedisCache as DjangoRedisCache
+except ImportError:
+    DjangoRedisCache = None
+
+# The (cache, operation) being observed in the current context.
+_current_operation = ContextVar("django_prometheus_current_cache_operation", default=None)
+
+
+class _OperationChildren:
+    """The children of the metrics of an operation of a backend."""
+
+    __slots__ = ("operations", "errors", "durations")
+
+    def __init__(self, backend, operation):
+        self.operations = django_cache_operations_total.labels(backend, operation)
+        self.errors = django_cache_operation_errors_total.labels(backend, operation)
+        self.durations = django_cache_operation_duration_seconds.labels(backend, operation)
+
+
+_operation_children = {}
+
+
+def _OperationChildrenOf(backend, operation):
+    key = (backend, operation)
+    children = _operation_children.get(key)
+    if children is None:
+        children = _operation_children.setdefault(key, _OperationChildren(backend, operation))
+    return children
+
+
+def _Size(payload):
+    if isinstance(payload, (bytes, bytearray, memoryview, str)):
+        return len(payload)
+    # e.g. integers, which Django's RedisSerializer doesn't pickle.
+    return len(str(payload))
+
+
+class SizeObservingCodec:
+    """Wraps codec, which converts values to and from the payloads that a
+    backend stores, to observe the size of these payloads.
+
+    Codecs with dumps and loads (Django's RedisSerializer), compress and
+    decompress (django-redis' compressors) or serialize and deserialize
+    (pymemcache's serdes) methods are supported.
+    """
+
+    def __init__(self, codec, backend):
+        self._codec = codec
+        self._set_sizes = django_cache_set_value_size_bytes.labels(backend)
+        self._get_sizes = django_cache_get_value_size_bytes.labels(backend)
+
+    def __getattr__(self, attr):
+        return getattr(self._codec, attr)
+
+    def dumps(self, value):
+        payload = self._codec.dumps(value)
+        self._set_sizes.observe(_Size(payload))
+        return payload
+
+    def loads(self, payload):
+        self._get_sizes.observe(_Size(payload))
+        return self._codec.loads(payload)
+
+    def compress(self, value):
+        payload = self._codec.compress(value)
+        self._set_sizes.observe(_Size(payload))
+        return payload
+
+    def decompress(self, payload):
+        self._get_sizes.observe(_Size(payload))
+        return self._codec.decompress(payload)
+
+    def serialize(self, key, value):
+        payload, flags = self._codec.serialize(key, value)
+        self._set_sizes.observe(_Size(payload))
+        return payload, flags
+
+    def deserialize(self, key, payload, flags):
+        self._get_sizes.observe(_Size(payload))
+        return self._codec.deserialize(key, payload, flags)
+
+
+def ObserveValueSizes(cache, backend):
+    """Observes the sizes of the values that cache stores and loads.
+
+    Sizes are measured from the payloads that the client of the backend
+    serializes values to, so that values aren't serialized twice. This
+    is only possible with Django's RedisCache and PyMemcacheCache, and
+    django-redis' RedisCache, where they are measured after compression.
+    Returns whether the backend of cache is supported.
+    """
+    if isinstance(cache, RedisCache):
+        serializer = cache._options.get("serializer")
+        if isinstance(serializer, str):
+            serializer = import_string(serializer)
+        if callable(serializer):
+            serializer = serializer()
+        # The options are the settings' own dict, and are not modified.
+        cache._options = {**cache._options, "serializer": SizeObservingCodec(serializer or RedisSerializer(), backend)}
+        return True
+    if isinstance(cache, PyMemcacheCache):
+        cache._options = {**cache._options, "serde": SizeObservingCodec(cache._options["serde"], backend)}
+        return True
+    if DjangoRedisCache is not None and isinstance(cache, DjangoRedisCache):
+        client = cache.client
+        client._compressor = SizeObservingCodec(client._compressor, backend)
+        return True
+    return False
+
+
+class CacheMetricsMixin:
+    """Extends a cache backend to count and time its operations.
+
+    prometheus_backend is the value of the backend label of its metrics.
+
+    Backends implement some operations with others, e.g. BaseCache's
+    get_or_set calls get and add. Only the outermost operation is
+    counted and timed, so that the time spent in the cache isn't
+    counted twice. Hits and misses are counted for every get, and
+    for every key of get_many, in bulk.
+
+    If PROMETHEUS_CACHE_HOT_KEYS is set, the keys of the outermost
+    operations are tracked, see HotKeys.
+
+    If PROMETHEUS_CACHE_VALUE_SIZES is set, the sizes of the values are
+    also observed when the backend supports it, see ObserveValueSizes.
+    """
+
+    prometheus_backend = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if PROMETHEUS_CACHE_VALUE_SIZES:
+            ObserveValueSizes(self, self.prometheus_backend)
+
+    def _prometheus_current_operation(self):
+        current = _current_operation.get()
+        if current is not None and current[0] is self:
+            return current[1]
+        return None
+
+    def _prometheus_observe_keys(self, keys):
+        if metrics.hot_keys is not None and self._prometheus_current_operation() is None:
+            metrics.hot_keys.observe(self.prometheus_backend, keys)
+
+    def _prometheus_call(self, operation, method, *args, **kwargs):
+        if self._prometheus_current_operation() is not None:
+            return method(*args, **kwargs)
+        children = _OperationChildrenOf(self.prometheus_backend, operation)
+        children.operations.inc()
+        token = _current_operation.set((self, operation))
+        start = Time()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            children.errors.inc()
+            raise
+        finally:
+            children.durations.observe(TimeSince(start))
+            _current_operation.reset(token)
+
+    def _prometheus_observe_get(self, cached):
+        if cached is None:
+            django_cache_misses_total.labels(backend=self.prometheus_backend).inc()
+        else:
+            django_cache_hits_total.labels(backend=self.prometheus_backend).inc()
+
+    def get(self, key, default=None, *args, **kwargs):
+        if self._prometheus_current_operation() == "get_many":
+            # Counted in bulk by get_many.
+            return super().get(key, default, *args, **kwargs)
+        self._prometheus_observe_keys((key,))
+        django_cache_get_total.labels(backend=self.prometheus_backend).inc()
+        try:
+            cached = self._prometheus_call("get", super().get, key, None, *args, **kwargs)
+        except Exception:
+            django_cache_get_fail_total.labels(backend=self.prometheus_backend).inc()
+            raise
+        self._prometheus_observe_get(cached)
+        return default if cached is None else cached
+
+    def set(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("set", super().set, key, *args, **kwargs)
+
+    def add(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("add", super().add, key, *args, **kwargs)
+
+    def get_or_set(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("get_or_set", super().get_or_set, key, *args, **kwargs)
+
+    def touch(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("touch", super().touch, key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("delete", super().delete, key, *args, **kwargs)
+
+    def has_key(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("has_key", super().has_key, key, *args, **kwargs)
+
+    def incr(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("incr", super().incr, key, *args, **kwargs)
+
+    def decr(self, key, *args, **kwargs):
+        self._prometheus_observe_keys((key,))
+        return self._prometheus_call("decr", super().decr, key, *args, **kwargs)
+
+    def get_many(self, keys, *args, **kwargs):
+        if not hasattr(keys, "__len__"):
+            keys = list(keys)
+        self._prometheus_observe_keys(keys)
+        backend = self.prometheus_backend
+        django_cache_get_total.labels(backend=backend).inc(len(keys))
+        django_cache_batch_size.labels(backend, "get_many").observe(len(keys))
+        try:
+            found = self._prometheus_call("get_many", super().get_many, keys, *args, **kwargs)
+        except Exception:
+            django_cache_get_fail_total.labels(backend=backend).inc(len(keys))
+            raise
+        if found:
+            django_cache_hits_total.labels(backend=backend).inc(len(found))
+        if len(keys) > len(found):
+            django_cache_misses_total.labels(backend=backend).inc(len(keys) - len(found))
+        return found
+
+    def set_many(self, data, *args, **kwargs):
+        self._prometheus_observe_keys(data)
+        django_cache_batch_size.labels(self.prometheus_backend, "set_many").observe(len(data))
+        return self._prometheus_call("set_many", super().set_many, data, *args, **kwargs)
+
+    def delete_many(self, keys, *args, **kwargs):
+        if not hasattr(keys, "__len__"):
+            keys = list(keys)
+        self._prometheus_observe_keys(keys)
+        django_cache_batch_size.labels(self.prometheus_backend, "delete_many").observe(len(keys))
+        return self._prometheus_call("delete_many", super().delete_many, keys, *args, **kwargs)
+
+    def clear(self, *args, **kwargs):
+        return self._prometheus_call("clear", super().clear, *args, **kwargs)
@@ -1,6 +1,24 @@
-from prometheus_client import Counter
+import hashlib
+import random
 
-from django_prometheus.conf import NAMESPACE
+from django.utils.module_loading import import_string
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.metrics_core import CounterMetricFamily
+
+from django_prometheus.conf import (
+    NAMESPACE,
+    PROMETHEUS_CACHE_HOT_KEY_FUNCTION,
+    PROMETHEUS_CACHE_HOT_KEY_LABEL_LENGTH,
+    PROMETHEUS_CACHE_HOT_KEY_SAMPLE_RATE,
+    PROMETHEUS_CACHE_HOT_KEYS,
+    PROMETHEUS_CACHE_LATENCY_BUCKETS,
+)
+from django_prometheus.shards import shardable
+from django_prometheus.topk import ShortenLabel, SpaceSaving
+from django_prometheus.utils import PowersOf
+
+# These metrics are updated for every cache access, see django_prometheus.shards.
+Counter, Histogram = shardable(Counter), shardable(Histogram)
 
 django_cache_get_total = Counter(
     "django_cache_get_total",
@@ -26,3 +44,107 @@ django_cache_get_fail_total = Counter(
     ["backend"],
     namespace=NAMESPACE,
 )
+django_cache_operations_total = Counter(
+    "django_cache_operations_total",
+    "Total operations on cache by operation",
+    ["backend", "operation"],
+    namespace=NAMESPACE,
+)
+django_cache_operation_errors_total = Counter(
+    "django_cache_operation_errors_total",
+    "Total operations on cache that raised an exception by operation",
+    ["backend", "operation"],
+    namespace=NAMESPACE,
+)
+django_cache_operation_duration_seconds = Histogram(
+    "django_cache_operation_duration_seconds",
+    "Histogram of the duration of cache operations by operation",
+    ["backend", "operation"],
+    buckets=PROMETHEUS_CACHE_LATENCY_BUCKETS,
+    namespace=NAMESPACE,
+)
+django_cache_batch_size = Histogram(
+    "django_cache_batch_size",
+    "Histogram of the number of keys of bulk cache operations by operation",
+    ["backend", "operation"],
+    buckets=PowersOf(2, 12),
+    namespace=NAMESPACE,
+)
+django_cache_set_value_size_bytes = Histogram(
+    "django_cache_set_value_size_bytes",
+    "Histogram of the serialized size of the values stored in cache",
+    ["backend"],
+    buckets=PowersOf(2, 30),
+    namespace=NAMESPACE,
+)
+django_cache_get_value_size_bytes = Histogram(
+    "django_cache_get_value_size_bytes",
+    "Histogram of the serialized size of the values loaded from cache",
+    ["backend"],
+    buckets=PowersOf(2, 30),
+    namespace=NAMESPACE,
+)
+
+
+class HotKeys:
+    """Exports the number of accesses of the most accessed cache keys.
+
+    Keys can hold session identifiers or user data, and the metrics
+    endpoint is usually not authenticated, so they are exported as
+    digests. key_function, a function or its dotted path, can map them
+    to values that are safe to export instead, e.g. their prefix; keys
+    it maps to None are ignored. Values longer than label_length are
+    shortened.
+
+    Only the capacity most accessed keys are tracked, see SpaceSaving,
+    so memory use and the number of series are bounded. A key's series
+    counts the accesses since it last started being tracked, like
+    TopQueries. Only a sample_rate fraction of the accesses are
+    tracked, and counts are scaled accordingly.
+    """
+
+    def __init__(
+        self,
+        capacity,
+        key_function=None,
+        label_length=PROMETHEUS_CACHE_HOT_KEY_LABEL_LENGTH,
+        sample_rate=PROMETHEUS_CACHE_HOT_KEY_SAMPLE_RATE,
+        registry=REGISTRY,
+    ):
+        self._keys = SpaceSaving(capacity)
+        if isinstance(key_function, str):
+            key_function = import_string(key_function)
+        self._key_function = key_function
+        self._label_length = label_length
+        self._sample_rate = sample_rate
+        prefix = f"{NAMESPACE}_" if NAMESPACE else ""
+        self._accesses_name = f"{prefix}django_cache_hot_key_accesses"
+        if registry:
+            registry.register(self)
+
+    def observe(self, backend, keys):
+        if self._sample_rate < 1 and random.random() >= self._sample_rate:
+            return
+        key_function = self._key_function
+        if key_function is None:
+            self._keys.observe_many((backend, key) for key in keys)
+        else:
+            mapped = ((backend, key_function(key)) for key in keys)
+            self._keys.observe_many(key for key in mapped if key[1] is not None)
+
+    def collect(self):
+        accesses = CounterMetricFamily(
+            self._accesses_name,
+            "Approximate count of accesses to the most accessed keys by cache.",
+            labels=["backend", "key"],
+        )
+        for (backend, key), count, error, _ in self._keys.top():
+            if self._key_function is None:
+                label = hashlib.blake2b(str(key).encode(), digest_size=8).hexdigest()
+            else:
+                label = ShortenLabel(str(key), self._label_length)
+            accesses.add_metric([backend, label], (count - error) / self._sample_rate)
+        return [accesses]
+
+
+hot_keys = HotKeys(PROMETHEUS_CACHE_HOT_KEYS, PROMETHEUS_CACHE_HOT_KEY_FUNCTION) if PROMETHEUS_CACHE_HOT_KEYS else None
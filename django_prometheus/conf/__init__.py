@@ -22,6 +22,109 @@ PROMETHEUS_LATENCY_BUCKETS = (
     float("inf"),
 )
 
+# Cache operations are usually much faster than requests or queries.
+PROMETHEUS_CACHE_LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    float("inf"),
+)
+
+PROMETHEUS_SHARDED_METRICS = False
+
+# Whether the sizes of cached values are observed, see
+# django_prometheus.cache.common.ObserveValueSizes.
+PROMETHEUS_CACHE_VALUE_SIZES = False
+
+# Number of cache keys tracked by django_cache_hot_key_accesses (0
+# disables), the function, or its dotted path, that maps keys to the
+# exported value, e.g. their prefix (None exports digests of the keys),
+# the length that longer values are shortened to in labels, and the
+# fraction of accesses that are tracked.
+PROMETHEUS_CACHE_HOT_KEYS = 0
+PROMETHEUS_CACHE_HOT_KEY_FUNCTION = None
+PROMETHEUS_CACHE_HOT_KEY_LABEL_LENGTH = 100
+PROMETHEUS_CACHE_HOT_KEY_SAMPLE_RATE = 1.0
+
+# Number of SQL fingerprints tracked by django_db_top_query_* (0 disables),
+# and the length that longer fingerprints are shortened to in labels.
+PROMETHEUS_DB_TOP_QUERIES = 0
+PROMETHEUS_DB_TOP_QUERY_LABEL_LENGTH = 200
+
+# Queries slower than this many seconds are captured (None disables),
+# see django_prometheus.slow_queries.
+PROMETHEUS_DB_SLOW_QUERY_THRESHOLD = None
+PROMETHEUS_DB_SLOW_QUERY_BUFFER_SIZE = 100
+PROMETHEUS_DB_SLOW_QUERY_SAMPLE_RATE = 1.0
+
+# Whether django_db_transaction_duration_seconds has a view label.
+PROMETHEUS_DB_TRANSACTION_VIEW_LABEL = False
+
+# Whether the execution, duration and error metrics of queries have a
+# statement label (SELECT, INSERT, UPDATE, DELETE, DDL, ...).
+PROMETHEUS_DB_STATEMENT_LABEL = False
+
 if settings.configured:
     NAMESPACE = getattr(settings, "PROMETHEUS_METRIC_NAMESPACE", NAMESPACE)
     PROMETHEUS_LATENCY_BUCKETS = getattr(settings, "PROMETHEUS_LATENCY_BUCKETS", PROMETHEUS_LATENCY_BUCKETS)
+    PROMETHEUS_CACHE_LATENCY_BUCKETS = getattr(
+        settings,
+        "PROMETHEUS_CACHE_LATENCY_BUCKETS",
+        PROMETHEUS_CACHE_LATENCY_BUCKETS,
+    )
+    PROMETHEUS_SHARDED_METRICS = getattr(settings, "PROMETHEUS_SHARDED_METRICS", PROMETHEUS_SHARDED_METRICS)
+    PROMETHEUS_CACHE_VALUE_SIZES = getattr(settings, "PROMETHEUS_CACHE_VALUE_SIZES", PROMETHEUS_CACHE_VALUE_SIZES)
+    PROMETHEUS_CACHE_HOT_KEYS = getattr(settings, "PROMETHEUS_CACHE_HOT_KEYS", PROMETHEUS_CACHE_HOT_KEYS)
+    PROMETHEUS_CACHE_HOT_KEY_FUNCTION = getattr(
+        settings,
+        "PROMETHEUS_CACHE_HOT_KEY_FUNCTION",
+        PROMETHEUS_CACHE_HOT_KEY_FUNCTION,
+    )
+    PROMETHEUS_CACHE_HOT_KEY_LABEL_LENGTH = getattr(
+        settings,
+        "PROMETHEUS_CACHE_HOT_KEY_LABEL_LENGTH",
+        PROMETHEUS_CACHE_HOT_KEY_LABEL_LENGTH,
+    )
+    PROMETHEUS_CACHE_HOT_KEY_SAMPLE_RATE = getattr(
+        settings,
+        "PROMETHEUS_CACHE_HOT_KEY_SAMPLE_RATE",
+        PROMETHEUS_CACHE_HOT_KEY_SAMPLE_RATE,
+    )
+    PROMETHEUS_DB_TOP_QUERIES = getattr(settings, "PROMETHEUS_DB_TOP_QUERIES", PROMETHEUS_DB_TOP_QUERIES)
+    PROMETHEUS_DB_TOP_QUERY_LABEL_LENGTH = getattr(
+        settings,
+        "PROMETHEUS_DB_TOP_QUERY_LABEL_LENGTH",
+        PROMETHEUS_DB_TOP_QUERY_LABEL_LENGTH,
+    )
+    PROMETHEUS_DB_SLOW_QUERY_THRESHOLD = getattr(
+        settings,
+        "PROMETHEUS_DB_SLOW_QUERY_THRESHOLD",
+        PROMETHEUS_DB_SLOW_QUERY_THRESHOLD,
+    )
+    PROMETHEUS_DB_SLOW_QUERY_BUFFER_SIZE = getattr(
+        settings,
+        "PROMETHEUS_DB_SLOW_QUERY_BUFFER_SIZE",
+        PROMETHEUS_DB_SLOW_QUERY_BUFFER_SIZE,
+    )
+    PROMETHEUS_DB_SLOW_QUERY_SAMPLE_RATE = getattr(
+        settings,
+        "PROMETHEUS_DB_SLOW_QUERY_SAMPLE_RATE",
+        PROMETHEUS_DB_SLOW_QUERY_SAMPLE_RATE,
+    )
+    PROMETHEUS_DB_TRANSACTION_VIEW_LABEL = getattr(
+        settings,
+        "PROMETHEUS_DB_TRANSACTION_VIEW_LABEL",
+        PROMETHEUS_DB_TRANSACTION_VIEW_LABEL,
+    )
+    PROMETHEUS_DB_STATEMENT_LABEL = getattr(settings, "PROMETHEUS_DB_STATEMENT_LABEL", PROMETHEUS_DB_STATEMENT_LABEL)
@@ -1,20 +1,52 @@
 # Import all metrics
 from django_prometheus.db.metrics import (
     Counter,
+    commits_total,
+    connection_age_seconds,
     connection_errors_total,
+    connection_pools,
+    connection_queries,
     connections_total,
     errors_total,
+    execute_many_batch_size,
+    execute_many_rows_per_second,
     execute_many_total,
     execute_total,
+    health_check_failures_total,
+    health_check_seconds,
+    pool_checkout_seconds,
+    pool_hold_seconds,
     query_duration_seconds,
+    rollbacks_total,
+    rows_affected,
+    rows_fetched,
+    savepoints_total,
+    top_queries,
+    transaction_duration_seconds,
 )
 
 __all__ = [
     "Counter",
+    "commits_total",
+    "connection_age_seconds",
     "connection_errors_total",
+    "connection_pools",
+    "connection_queries",
     "connections_total",
     "errors_total",
+    "execute_many_batch_size",
+    "execute_many_rows_per_second",
     "execute_many_total",
     "execute_total",
+    "health_check_failures_total",
+    "health_check_seconds",
+    "pool_checkout_seconds",
+    "pool_hold_seconds",
     "query_duration_seconds",
+    "rollbacks_total",
+    "rows_affected",
+    "rows_fetched",
+    "savepoints_total",
+    "top_queries",
+    "transaction_duration_seconds",
 ]
@@ -13,4 +13,4 @@ class DatabaseWrapper(DatabaseWrapperMixin, base.DatabaseWrapper):
     def create_cursor(self, name=None):
         cursor = self.connection.cursor()
         CursorWrapper = ExportingCursorWrapper(self.CURSOR_CLASS, self.alias, self.vendor)
-        return CursorWrapper(cursor)
+        return self._prometheus_track_cursor(CursorWrapper(cursor))
@@ -0,0 +1,100 @@
+"""A database engine that instruments any other engine.
+
+The engine to instrument is set by the WRAPPED_ENGINE option, e.g.:
+
+    DATABASES = {
+        "default": {
+            "ENGINE": "django_prometheus.db.backends.wrapped",
+            "OPTIONS": {"WRAPPED_ENGINE": "django.db.backends.oracle"},
+            ...
+        },
+    }
+
+An instrumented DatabaseWrapper class is built, once, for each wrapped
+engine. Its cursors are wrapped in a proxy that delegates to the
+cursors of the wrapped engine, so no knowledge of their class is needed.
+"""
+
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.utils import load_backend
+
+from django_prometheus.db.common import DatabaseWrapperMixin, ExportingCursorWrapper
+
+WRAPPED_ENGINE_OPTION = "WRAPPED_ENGINE"
+
+_database_wrappers = {}
+_database_wrappers_lock = threading.Lock()
+
+
+class DelegatingCursor:
+    """Delegates to cursor, a cursor of any class."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self.cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def InstrumentedDatabaseWrapper(engine):
+    """Returns an instrumented DatabaseWrapper class for engine.
+
+    Classes are created once per engine and then reused. Engines that
+    are already instrumented are returned as is.
+    """
+    wrapper = _database_wrappers.get(engine)
+    if wrapper is None:
+        with _database_wrappers_lock:
+            wrapper = _database_wrappers.get(engine)
+            if wrapper is None:
+                wrapper = _database_wrappers[engine] = _MakeInstrumentedDatabaseWrapper(engine)
+    return wrapper
+
+
+def _MakeInstrumentedDatabaseWrapper(engine):
+    if engine == __name__.rpartition(".")[0]:
+        raise ImproperlyConfigured(f"{WRAPPED_ENGINE_OPTION} can't be {engine} itself.")
+    base = load_backend(engine).DatabaseWrapper
+    if issubclass(base, DatabaseWrapperMixin):
+        return base
+
+    class DatabaseWrapper(DatabaseWrapperMixin, base):
+        def get_connection_params(self):
+            params = super().get_connection_params()
+            # Most engines pass their OPTIONS on to the database driver.
+            if isinstance(params, dict):
+                params.pop(WRAPPED_ENGINE_OPTION, None)
+            return params
+
+        def create_cursor(self, name=None):
+            # Let the wrapped engine create its cursor, as DatabaseWrapperMixin's
+            # create_cursor only works with sqlite.
+            cursor = super(DatabaseWrapperMixin, self).create_cursor(name)
+            cursor = ExportingCursorWrapper(DelegatingCursor, self.alias, self.vendor)(cursor)
+            return self._prometheus_track_cursor(cursor)
+
+    DatabaseWrapper.__qualname__ = f"DatabaseWrapper[{engine}]"
+    return DatabaseWrapper
+
+
+class DatabaseWrapper:
+    """Creates instances of the instrumented DatabaseWrapper of the
+    engine set by OPTIONS["WRAPPED_ENGINE"].
+    """
+
+    def __new__(cls, settings_dict, *args, **kwargs):
+        engine = settings_dict.get("OPTIONS", {}).get(WRAPPED_ENGINE_OPTION)
+        if not engine:
+            raise ImproperlyConfigured(f"The {WRAPPED_ENGINE_OPTION} option must be set to the engine to instrument.")
+        return InstrumentedDatabaseWrapper(engine)(settings_dict, *args, **kwargs)
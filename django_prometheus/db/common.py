@@ -1,11 +1,53 @@
+import threading
+
+from django_prometheus import slow_queries
+from django_prometheus.conf import PROMETHEUS_DB_STATEMENT_LABEL, PROMETHEUS_DB_TRANSACTION_VIEW_LABEL
 from django_prometheus.db import (
+    commits_total,
+    connection_age_seconds,
     connection_errors_total,
+    connection_pools,
+    connection_queries,
     connections_total,
     errors_total,
+    execute_many_batch_size,
+    execute_many_rows_per_second,
     execute_many_total,
     execute_total,
+    health_check_failures_total,
+    health_check_seconds,
+    metrics,
+    pool_checkout_seconds,
+    pool_hold_seconds,
     query_duration_seconds,
+    rollbacks_total,
+    rows_affected,
+    rows_fetched,
+    savepoints_total,
+    transaction_duration_seconds,
+)
+from django_prometheus.db.sql import StatementType
+from django_prometheus.request_stats import (  # noqa: F401
+    GetRequestDatabaseStats,
+    RequestDatabaseStats,
+    SetRequestDatabaseStats,
+    _request_stats,
 )
+from django_prometheus.utils import Time, TimeSince
+
+
+class ConnectionStats:
+    """Accumulates the activity of a database connection.
+
+    DatabaseWrapperMixin creates one for each new connection, and hands
+    it to the cursors it creates, which count their queries in it.
+    """
+
+    __slots__ = ("opened", "queries")
+
+    def __init__(self):
+        self.opened = Time()
+        self.queries = 0
 
 
 class ExceptionCounterByType:
@@ -37,44 +79,434 @@ class ExceptionCounterByType:
 
 
 class DatabaseWrapperMixin:
-    """Extends the DatabaseWrapper to count connections and cursors."""
+    """Extends the DatabaseWrapper to count connections and cursors.
+
+    The age of connections and the number of queries they served are
+    observed when they are closed, and health checks are timed.
+
+    Transactions start when autocommit is turned off, e.g. by the
+    outermost atomic block, and end when they are committed or rolled
+    back. Savepoints, which inner atomic blocks use, are counted.
+
+    With backends that use a connection pool, getting a new connection
+    checks one out of the pool, and closing it returns it to the pool.
+    The time spent waiting for and holding connections is observed.
+    """
+
+    # When the current connection was checked out of the pool, if any.
+    _prometheus_checked_out = None
+    # The ConnectionStats of the current connection, if any.
+    _prometheus_connection_stats = None
+    # When the current transaction started, if any.
+    _prometheus_transaction_start = None
 
     def get_new_connection(self, *args, **kwargs):
         connections_total.labels(self.alias, self.vendor).inc()
         try:
-            return super().get_new_connection(*args, **kwargs)
+            pool = getattr(self, "pool", None)
+            start = Time()
+            connection = super().get_new_connection(*args, **kwargs)
         except Exception:
             connection_errors_total.labels(self.alias, self.vendor).inc()
             raise
+        if pool is not None:
+            pool_checkout_seconds.labels(self.alias, self.vendor).observe(TimeSince(start))
+            connection_pools.track(self.alias, self.vendor, pool)
+            self._prometheus_checked_out = Time()
+        self._prometheus_connection_stats = ConnectionStats()
+        return connection
+
+    def _close(self):
+        if self._prometheus_checked_out is not None:
+            pool_hold_seconds.labels(self.alias, self.vendor).observe(TimeSince(self._prometheus_checked_out))
+            self._prometheus_checked_out = None
+        stats = self._prometheus_connection_stats
+        if stats is not None:
+            connection_age_seconds.labels(self.alias, self.vendor).observe(TimeSince(stats.opened))
+            connection_queries.labels(self.alias, self.vendor).observe(stats.queries)
+            self._prometheus_connection_stats = None
+        self._prometheus_transaction_start = None
+        return super()._close()
+
+    def set_autocommit(self, autocommit, *args, **kwargs):
+        super().set_autocommit(autocommit, *args, **kwargs)
+        if autocommit:
+            self._prometheus_transaction_start = None
+        elif self._prometheus_transaction_start is None:
+            self._prometheus_transaction_start = Time()
+
+    def _end_transaction(self, counter):
+        start = self._prometheus_transaction_start
+        if start is None:
+            return
+        labels = {"alias": self.alias, "vendor": self.vendor}
+        counter.labels(**labels).inc()
+        if PROMETHEUS_DB_TRANSACTION_VIEW_LABEL:
+            stats = _request_stats.get()
+            labels["view"] = (stats and stats.view) or ""
+        transaction_duration_seconds.labels(**labels).observe(TimeSince(start))
+        # Without autocommit, the next transaction starts right away.
+        self._prometheus_transaction_start = None if self.autocommit else Time()
+
+    def _commit(self):
+        result = super()._commit()
+        self._end_transaction(commits_total)
+        return result
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._end_transaction(rollbacks_total)
+
+    def _savepoint(self, sid):
+        savepoints_total.labels(self.alias, self.vendor).inc()
+        return super()._savepoint(sid)
+
+    def is_usable(self):
+        start = Time()
+        usable = super().is_usable()
+        health_check_seconds.labels(self.alias, self.vendor).observe(TimeSince(start))
+        if not usable:
+            health_check_failures_total.labels(self.alias, self.vendor).inc()
+        return usable
 
     def create_cursor(self, name=None):
-        return self.connection.cursor(factory=ExportingCursorWrapper(self.CURSOR_CLASS, self.alias, self.vendor))
+        cursor = self.connection.cursor(factory=ExportingCursorWrapper(self.CURSOR_CLASS, self.alias, self.vendor))
+        return self._prometheus_track_cursor(cursor)
+
+    def _prometheus_track_cursor(self, cursor):
+        """Makes cursor count its queries in the stats of the connection.
+
+        Cursors that don't count events, like psycopg's server-side
+        cursors, which may not have a __dict__, are returned as is.
+        """
+        if isinstance(cursor, _Exporting):
+            cursor._prometheus_connection_stats = self._prometheus_connection_stats
+        return cursor
+
+
+_cursor_wrappers = {}
+_cursor_wrappers_lock = threading.Lock()
 
 
 def ExportingCursorWrapper(cursor_class, alias, vendor):
     """Returns a CursorWrapper class that knows its database's alias and
     vendor name.
+
+    Classes are created once per (cursor_class, alias, vendor) and then
+    reused, as backends ask for one every time they create a cursor.
+    """
+    return _CachedCursorWrapper(cursor_class, alias, vendor, False)
+
+
+def ExportingAsyncCursorWrapper(cursor_class, alias, vendor):
+    """Returns an async CursorWrapper class that knows its database's
+    alias and vendor name.
+
+    It is the counterpart of ExportingCursorWrapper for cursors whose
+    execute and fetch methods are coroutines, like psycopg's
+    AsyncCursor, e.g.:
+
+        connection = await psycopg.AsyncConnection.connect(
+            ...,
+            cursor_factory=ExportingAsyncCursorWrapper(
+                psycopg.AsyncCursor, "default", "postgresql"),
+        )
+
+    Queries are timed in the event loop, without a hop to a thread, and
+    are recorded into the same metrics as the synchronous ones.
+    """
+    return _CachedCursorWrapper(cursor_class, alias, vendor, True)
+
+
+def IsExportingCursorWrapper(cursor_class):
+    """Returns whether cursor_class already counts events.
+
+    Pooled connections are handed out again and again, and their cursor
+    factory must only be wrapped the first time.
+    """
+    return isinstance(cursor_class, type) and issubclass(cursor_class, _Exporting)
+
+
+class _Exporting:
+    """The base class of the classes that ExportingCursorWrapper and
+    ExportingAsyncCursorWrapper return."""
+
+
+def _CachedCursorWrapper(cursor_class, alias, vendor, is_async):
+    key = (cursor_class, alias, vendor, is_async)
+    wrapper = _cursor_wrappers.get(key)
+    if wrapper is None:
+        with _cursor_wrappers_lock:
+            wrapper = _cursor_wrappers.get(key)
+            if wrapper is None:
+                wrapper = _cursor_wrappers[key] = _MakeExportingCursorWrapper(cursor_class, alias, vendor, is_async)
+    return wrapper
+
+
+class _CountingIterator:
+    """Iterates over iterable, counting the items it yields."""
+
+    __slots__ = ("_iterator", "count")
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self.count += 1
+        return item
+
+
+def _Inherited(cursor_class, name):
+    """Returns the method name of cursor_class.
+
+    Cursor classes that wrap another cursor, like MySQL's CursorWrapper,
+    may delegate their methods to it with __getattr__.
     """
-    labels = {"alias": alias, "vendor": vendor}
+    method = getattr(cursor_class, name, None)
+    if method is not None:
+        return method
+    return lambda self, *args, **kwargs: cursor_class.__getattr__(self, name)(*args, **kwargs)
+
+
+class _StatementChildren:
+    """The children of the metrics labelled by statement type."""
+
+    __slots__ = ("labels", "executions", "durations")
+
+    def __init__(self, alias, vendor, statement=None):
+        self.labels = {"alias": alias, "vendor": vendor}
+        if statement is not None:
+            self.labels["statement"] = statement
+        self.executions = execute_total.labels(**self.labels)
+        self.durations = query_duration_seconds.labels(**self.labels)
+
+
+def _MakeExportingCursorWrapper(cursor_class, alias, vendor, is_async=False):
+    # Children of the labelled metrics are resolved once per class, and
+    # per statement type if PROMETHEUS_DB_STATEMENT_LABEL is set.
+    if PROMETHEUS_DB_STATEMENT_LABEL:
+        by_statement = {}
+
+        def StatementChildren(query):
+            statement = StatementType(query)
+            children = by_statement.get(statement)
+            if children is None:
+                children = by_statement.setdefault(statement, _StatementChildren(alias, vendor, statement))
+            return children
+
+    else:
+        children = _StatementChildren(alias, vendor)
+
+        def StatementChildren(query):
+            return children
+
+    bulk_executions = execute_many_total.labels(alias, vendor)
+    batch_sizes = execute_many_batch_size.labels(alias, vendor)
+    throughput = execute_many_rows_per_second.labels(alias, vendor)
+    affected = rows_affected.labels(alias, vendor)
+    fetched = rows_fetched.labels(alias, vendor)
+    fetchone = _Inherited(cursor_class, "fetchone")
+    fetchmany = _Inherited(cursor_class, "fetchmany")
+    fetchall = _Inherited(cursor_class, "fetchall")
+    close = _Inherited(cursor_class, "close")
+    # Not every cursor class is iterable, and __getattr__ isn't used to
+    # look special methods up. Cursors that are their own iterator, like
+    # sqlite3's, yield their rows from __next__.
+    iterate = getattr(cursor_class, "__iter__", None)
+    next_row = getattr(cursor_class, "__next__", None)
+    iterate_async = getattr(cursor_class, "__aiter__", None)
+    next_row_async = getattr(cursor_class, "__anext__", None)
+
+    class Instrumentation(_Exporting):
+        """The bookkeeping shared by the sync and async CursorWrappers."""
+
+        # Set by the DatabaseWrapper that created the cursor.
+        _prometheus_connection_stats = None
+        # Rows fetched from the result of the last statement, if it had one.
+        _prometheus_rows_fetched = None
+
+        def _observe(self, start, query, children):
+            duration = TimeSince(start)
+            children.durations.observe(duration)
+            if self._prometheus_connection_stats is not None:
+                self._prometheus_connection_stats.queries += 1
+            if metrics.top_queries is not None:
+                metrics.top_queries.observe(alias, vendor, query, duration)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.duration += duration
+            if slow_queries.slow_query_log is not None:
+                slow_queries.slow_query_log.observe(alias, vendor, query, duration, stats and stats.view)
+            return duration
+
+        def _observe_many(self, start, query, children, count):
+            duration = self._observe(start, query, children)
+            children.executions.inc(count)
+            bulk_executions.inc(count)
+            batch_sizes.observe(count)
+            if duration > 0:
+                throughput.observe(count / duration)
+
+        def _observe_rows(self):
+            # Statements that return no rows have no description, and
+            # their rowcount is the number of rows they affected, or -1 or
+            # None if the driver doesn't know it.
+            if self.description is None:
+                rowcount = self.rowcount
+                if isinstance(rowcount, int) and rowcount >= 0:
+                    affected.observe(rowcount)
+            else:
+                self._prometheus_rows_fetched = 0
+
+        def _observe_fetched_rows(self):
+            if self._prometheus_rows_fetched is not None:
+                fetched.observe(self._prometheus_rows_fetched)
+                self._prometheus_rows_fetched = None
 
-    class CursorWrapper(cursor_class):
+        def _count_fetched_rows(self, count):
+            if self._prometheus_rows_fetched is not None:
+                self._prometheus_rows_fetched += count
+
+    if is_async:
+
+        class AsyncCursorWrapper(Instrumentation, cursor_class):
+            """Extends the base async CursorWrapper to count events."""
+
+            async def execute(self, query, *args, **kwargs):
+                children = StatementChildren(query)
+                children.executions.inc()
+                self._observe_fetched_rows()
+                start = Time()
+                try:
+                    with ExceptionCounterByType(errors_total, extra_labels=children.labels):
+                        result = await super().execute(query, *args, **kwargs)
+                finally:
+                    self._observe(start, query, children)
+                self._observe_rows()
+                return result
+
+            async def executemany(self, query, param_list, *args, **kwargs):
+                self._observe_fetched_rows()
+                counter = None if hasattr(param_list, "__len__") else _CountingIterator(param_list)
+                children = StatementChildren(query)
+                start = Time()
+                try:
+                    with ExceptionCounterByType(errors_total, extra_labels=children.labels):
+                        result = await super().executemany(
+                            query, param_list if counter is None else counter, *args, **kwargs
+                        )
+                finally:
+                    self._observe_many(start, query, children, len(param_list) if counter is None else counter.count)
+                self._observe_rows()
+                return result
+
+            async def fetchone(self):
+                row = await fetchone(self)
+                if row is not None:
+                    self._count_fetched_rows(1)
+                return row
+
+            async def fetchmany(self, *args, **kwargs):
+                rows = await fetchmany(self, *args, **kwargs)
+                self._count_fetched_rows(len(rows))
+                return rows
+
+            async def fetchall(self):
+                rows = await fetchall(self)
+                self._count_fetched_rows(len(rows))
+                return rows
+
+            async def close(self):
+                self._observe_fetched_rows()
+                return await close(self)
+
+            if next_row_async is not None:
+
+                async def __anext__(self):
+                    row = await next_row_async(self)
+                    self._count_fetched_rows(1)
+                    return row
+
+            elif iterate_async is not None:
+
+                async def __aiter__(self):
+                    async for row in iterate_async(self):
+                        self._count_fetched_rows(1)
+                        yield row
+
+        return AsyncCursorWrapper
+
+    class CursorWrapper(Instrumentation, cursor_class):
         """Extends the base CursorWrapper to count events."""
 
-        def execute(self, *args, **kwargs):
-            execute_total.labels(alias, vendor).inc()
-            with (
-                query_duration_seconds.labels(**labels).time(),
-                ExceptionCounterByType(errors_total, extra_labels=labels),
-            ):
-                return super().execute(*args, **kwargs)
+        def execute(self, query, *args, **kwargs):
+            children = StatementChildren(query)
+            children.executions.inc()
+            self._observe_fetched_rows()
+            start = Time()
+            try:
+                with ExceptionCounterByType(errors_total, extra_labels=children.labels):
+                    result = super().execute(query, *args, **kwargs)
+            finally:
+                self._observe(start, query, children)
+            self._observe_rows()
+            return result
 
         def executemany(self, query, param_list, *args, **kwargs):
-            execute_total.labels(alias, vendor).inc(len(param_list))
-            execute_many_total.labels(alias, vendor).inc(len(param_list))
-            with (
-                query_duration_seconds.labels(**labels).time(),
-                ExceptionCounterByType(errors_total, extra_labels=labels),
-            ):
-                return super().executemany(query, param_list, *args, **kwargs)
+            self._observe_fetched_rows()
+            # Iterators are counted as they are consumed, so that
+            # streamed bulk loads are not copied into a list.
+            counter = None if hasattr(param_list, "__len__") else _CountingIterator(param_list)
+            children = StatementChildren(query)
+            start = Time()
+            try:
+                with ExceptionCounterByType(errors_total, extra_labels=children.labels):
+                    result = super().executemany(query, param_list if counter is None else counter, *args, **kwargs)
+            finally:
+                self._observe_many(start, query, children, len(param_list) if counter is None else counter.count)
+            self._observe_rows()
+            return result
+
+        def fetchone(self):
+            row = fetchone(self)
+            if row is not None:
+                self._count_fetched_rows(1)
+            return row
+
+        def fetchmany(self, *args, **kwargs):
+            rows = fetchmany(self, *args, **kwargs)
+            self._count_fetched_rows(len(rows))
+            return rows
+
+        def fetchall(self):
+            rows = fetchall(self)
+            self._count_fetched_rows(len(rows))
+            return rows
+
+        def close(self):
+            self._observe_fetched_rows()
+            return close(self)
+
+        if next_row is not None:
+
+            def __next__(self):
+                row = next_row(self)
+                self._count_fetched_rows(1)
+                return row
+
+        elif iterate is not None:
+
+            def __iter__(self):
+                for row in iterate(self):
+                    self._count_fetched_rows(1)
+                    yield row
 
     return CursorWrapper
@@ -1,6 +1,24 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.metrics_core import CounterMetricFamily, GaugeMetricFamily
 
-from django_prometheus.conf import NAMESPACE, PROMETHEUS_LATENCY_BUCKETS
+from django_prometheus.conf import (
+    NAMESPACE,
+    PROMETHEUS_DB_STATEMENT_LABEL,
+    PROMETHEUS_DB_TOP_QUERIES,
+    PROMETHEUS_DB_TOP_QUERY_LABEL_LENGTH,
+    PROMETHEUS_DB_TRANSACTION_VIEW_LABEL,
+    PROMETHEUS_LATENCY_BUCKETS,
+)
+from django_prometheus.db.sql import Fingerprint
+from django_prometheus.shards import shardable
+from django_prometheus.topk import ShortenLabel, SpaceSaving
+from django_prometheus.utils import PowersOf
+
+# These metrics are updated for every query, see django_prometheus.shards.
+Counter, Histogram = shardable(Counter), shardable(Histogram)
+
+# The statement label is opt-in, see PROMETHEUS_DB_STATEMENT_LABEL.
+_statement = ["statement"] if PROMETHEUS_DB_STATEMENT_LABEL else []
 
 connections_total = Counter(
     "django_db_new_connections_total",
@@ -19,7 +37,7 @@ connection_errors_total = Counter(
 execute_total = Counter(
     "django_db_execute_total",
     ("Counter of executed statements by database and by vendor, including bulk executions."),
-    ["alias", "vendor"],
+    ["alias", "vendor", *_statement],
     namespace=NAMESPACE,
 )
 
@@ -31,18 +49,230 @@ execute_many_total = Counter(
     namespace=NAMESPACE,
 )
 
+execute_many_batch_size = Histogram(
+    "django_db_execute_many_batch_size",
+    "Histogram of the number of parameter sets of bulk operations by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PowersOf(2, 20),
+    namespace=NAMESPACE,
+)
+
+execute_many_rows_per_second = Histogram(
+    "django_db_execute_many_rows_per_second",
+    "Histogram of the throughput of bulk operations, in parameter sets per second, by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PowersOf(10, 8),
+    namespace=NAMESPACE,
+)
+
 
 errors_total = Counter(
     "django_db_errors_total",
     ("Counter of execution errors by database, vendor and exception type."),
-    ["alias", "vendor", "type"],
+    ["alias", "vendor", *_statement, "type"],
     namespace=NAMESPACE,
 )
 
 query_duration_seconds = Histogram(
     "django_db_query_duration_seconds",
     ("Histogram of query duration by database and vendor."),
+    ["alias", "vendor", *_statement],
+    buckets=PROMETHEUS_LATENCY_BUCKETS,
+    namespace=NAMESPACE,
+)
+
+rows_affected = Histogram(
+    "django_db_rows_affected",
+    "Histogram of the number of rows affected by statements by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PowersOf(2, 20),
+    namespace=NAMESPACE,
+)
+
+rows_fetched = Histogram(
+    "django_db_rows_fetched",
+    "Histogram of the number of rows fetched from the results of queries by database and vendor.",
     ["alias", "vendor"],
+    buckets=PowersOf(2, 20),
+    namespace=NAMESPACE,
+)
+
+# The view label is opt-in, see PROMETHEUS_DB_TRANSACTION_VIEW_LABEL.
+transaction_duration_seconds = Histogram(
+    "django_db_transaction_duration_seconds",
+    "Histogram of transaction duration by database and vendor.",
+    ["alias", "vendor", "view"] if PROMETHEUS_DB_TRANSACTION_VIEW_LABEL else ["alias", "vendor"],
     buckets=PROMETHEUS_LATENCY_BUCKETS,
     namespace=NAMESPACE,
 )
+
+commits_total = Counter(
+    "django_db_commits_total",
+    "Counter of committed transactions by database and vendor.",
+    ["alias", "vendor"],
+    namespace=NAMESPACE,
+)
+
+rollbacks_total = Counter(
+    "django_db_rollbacks_total",
+    "Counter of rolled back transactions by database and vendor.",
+    ["alias", "vendor"],
+    namespace=NAMESPACE,
+)
+
+savepoints_total = Counter(
+    "django_db_savepoints_total",
+    "Counter of created savepoints by database and vendor.",
+    ["alias", "vendor"],
+    namespace=NAMESPACE,
+)
+
+connection_age_seconds = Histogram(
+    "django_db_connection_age_seconds",
+    "Histogram of the age of connections when they are closed by database and vendor.",
+    ["alias", "vendor"],
+    buckets=(0.1, 1, 10, 60, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600, float("inf")),
+    namespace=NAMESPACE,
+)
+
+connection_queries = Histogram(
+    "django_db_connection_queries",
+    "Histogram of the number of queries executed on connections when they are closed by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PowersOf(2, 20),
+    namespace=NAMESPACE,
+)
+
+health_check_seconds = Histogram(
+    "django_db_health_check_seconds",
+    "Histogram of the duration of connection health checks by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PROMETHEUS_LATENCY_BUCKETS,
+    namespace=NAMESPACE,
+)
+
+health_check_failures_total = Counter(
+    "django_db_health_check_failures_total",
+    "Counter of connections found unusable by health checks by database and vendor.",
+    ["alias", "vendor"],
+    namespace=NAMESPACE,
+)
+
+pool_checkout_seconds = Histogram(
+    "django_db_pool_checkout_seconds",
+    "Histogram of the time spent waiting for a connection from the pool by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PROMETHEUS_LATENCY_BUCKETS,
+    namespace=NAMESPACE,
+)
+
+pool_hold_seconds = Histogram(
+    "django_db_pool_connection_hold_seconds",
+    "Histogram of the time connections were held before being returned to the pool by database and vendor.",
+    ["alias", "vendor"],
+    buckets=PROMETHEUS_LATENCY_BUCKETS,
+    namespace=NAMESPACE,
+)
+
+
+class ConnectionPools:
+    """Exports the state of the connection pools of the databases.
+
+    Backends that use a connection pool, like PostgreSQL with
+    OPTIONS["pool"] since Django 5.1, track it when they check a
+    connection out of it. Pools must have psycopg_pool's get_stats().
+
+    It only exports the pools of its own process, so it is not available
+    in multiprocess mode.
+    """
+
+    def __init__(self, registry=REGISTRY):
+        # Maps (alias, vendor) to pools.
+        self._pools = {}
+        prefix = f"{NAMESPACE}_" if NAMESPACE else ""
+        self._prefix = f"{prefix}django_db_pool_"
+        if registry:
+            registry.register(self)
+
+    def track(self, alias, vendor, pool):
+        self._pools[(alias, vendor)] = pool
+
+    def collect(self):
+        labels = ["alias", "vendor"]
+        families = {
+            "pool_size": GaugeMetricFamily(
+                self._prefix + "size",
+                "Number of connections managed by the pool by database and vendor.",
+                labels=labels,
+            ),
+            "pool_available": GaugeMetricFamily(
+                self._prefix + "idle_connections",
+                "Number of idle connections in the pool by database and vendor.",
+                labels=labels,
+            ),
+            "in_use": GaugeMetricFamily(
+                self._prefix + "in_use_connections",
+                "Number of connections checked out of the pool by database and vendor.",
+                labels=labels,
+            ),
+            "requests_waiting": GaugeMetricFamily(
+                self._prefix + "requests_waiting",
+                "Number of requests waiting for a connection from the pool by database and vendor.",
+                labels=labels,
+            ),
+        }
+        for key, pool in list(self._pools.items()):
+            if getattr(pool, "closed", False):
+                continue
+            stats = pool.get_stats()
+            stats["in_use"] = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+            for name, family in families.items():
+                family.add_metric(key, stats.get(name, 0))
+        return list(families.values())
+
+
+connection_pools = ConnectionPools()
+
+
+class TopQueries:
+    """Exports the executions and duration of the most frequent queries.
+
+    Queries are grouped by SQL fingerprint, and only the capacity most
+    frequent fingerprints are tracked, see SpaceSaving. A fingerprint's
+    series count the executions since it last started being tracked,
+    like its duration, so the ratio of the two is its mean duration.
+    Fingerprints longer than label_length are shortened in labels.
+    """
+
+    def __init__(self, capacity, label_length=PROMETHEUS_DB_TOP_QUERY_LABEL_LENGTH, registry=REGISTRY):
+        self._queries = SpaceSaving(capacity)
+        self._label_length = label_length
+        prefix = f"{NAMESPACE}_" if NAMESPACE else ""
+        self._executions_name = f"{prefix}django_db_top_query_executions"
+        self._duration_name = f"{prefix}django_db_top_query_duration_seconds"
+        if registry:
+            registry.register(self)
+
+    def observe(self, alias, vendor, sql, duration):
+        self._queries.observe((alias, vendor, Fingerprint(sql)), duration)
+
+    def collect(self):
+        labels = ["alias", "vendor", "fingerprint"]
+        executions = CounterMetricFamily(
+            self._executions_name,
+            "Approximate count of executions of the most frequent queries by database, vendor and fingerprint.",
+            labels=labels,
+        )
+        duration = CounterMetricFamily(
+            self._duration_name,
+            "Total duration of the most frequent queries by database, vendor and fingerprint.",
+            labels=labels,
+        )
+        for (alias, vendor, fingerprint), count, error, total in self._queries.top():
+            key = [alias, vendor, ShortenLabel(fingerprint, self._label_length)]
+            executions.add_metric(key, count - error)
+            duration.add_metric(key, total)
+        return [executions, duration]
+
+
+top_queries = TopQueries(PROMETHEUS_DB_TOP_QUERIES) if PROMETHEUS_DB_TOP_QUERIES else None
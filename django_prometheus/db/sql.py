@@ -0,0 +1,124 @@
+"""Normalization and classification of SQL statements."""
+
+import re
+from functools import lru_cache
+
+_comments = re.compile(r"/\*.*?\*/|--[^\n]*", re.DOTALL)
+_strings = re.compile(r"'(?:[^']|'')*'")
+_placeholders = re.compile(r"%s|%\(\w+\)s|\?|\$\d+")
+_numbers = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_repeated_lists = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_whitespace = re.compile(r"\s+")
+_leading_keyword = re.compile(r"[\s(]*([a-zA-Z]+)")
+_quoted = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`")
+_tokens = re.compile(r"[(),]|[a-zA-Z_][\w$]*")
+
+# Maps leading keywords to statement types.
+_statement_types = {
+    "SELECT": "SELECT",
+    "VALUES": "SELECT",
+    "INSERT": "INSERT",
+    "REPLACE": "INSERT",
+    "UPDATE": "UPDATE",
+    "DELETE": "DELETE",
+    "CREATE": "DDL",
+    "ALTER": "DDL",
+    "DROP": "DDL",
+    "TRUNCATE": "DDL",
+    "RENAME": "DDL",
+    "COMMENT": "DDL",
+    "BEGIN": "TRANSACTION",
+    "START": "TRANSACTION",
+    "COMMIT": "TRANSACTION",
+    "ROLLBACK": "TRANSACTION",
+    "SAVEPOINT": "TRANSACTION",
+    "RELEASE": "TRANSACTION",
+}
+
+
+@lru_cache(maxsize=1024)
+def _Fingerprint(sql):
+    sql = _comments.sub(" ", sql)
+    sql = _strings.sub("?", sql)
+    sql = _placeholders.sub("?", sql)
+    sql = _numbers.sub("?", sql)
+    sql = _lists.sub("(...)", sql)
+    sql = _repeated_lists.sub("(...)", sql)
+    return _whitespace.sub(" ", sql).strip()
+
+
+def Fingerprint(sql):
+    """Returns the statement sql with its literals stripped.
+
+    Statements that only differ by their literal values, parameter
+    placeholders, comments or whitespace have the same fingerprint,
+    e.g. "SELECT * FROM t WHERE id IN (...)" is the fingerprint of
+    "SELECT * FROM t WHERE id IN (1, 2)" and of
+    "SELECT * FROM t WHERE id IN (%s, %s, %s)".
+
+    Results are memoized, as most applications run a small set of
+    distinct statements.
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    elif not isinstance(sql, str):
+        # e.g. psycopg's sql.Composed, which needs a connection to be
+        # rendered.
+        return f"<{type(sql).__name__}>"
+    return _Fingerprint(sql)
+
+
+@lru_cache(maxsize=1024)
+def _StatementType(sql):
+    match = _leading_keyword.match(_comments.sub(" ", sql))
+    if match is None:
+        return "OTHER"
+    keyword = match.group(1).upper()
+    if keyword == "WITH":
+        return _MainStatementType(sql[match.end() :])
+    return _statement_types.get(keyword, "OTHER")
+
+
+def _MainStatementType(sql):
+    """Classifies the statement that follows the common table
+    expressions sql, e.g. "x AS (SELECT 1) UPDATE t SET ...".
+
+    The bodies of the expressions, and literals and quoted identifiers,
+    are skipped, so that they don't affect the result.
+    """
+    depth = 0
+    # Whether the parenthesis being closed follows AS, i.e. encloses a
+    # body rather than a list of columns.
+    in_body = False
+    after_body = False
+    for token in _tokens.findall(_quoted.sub(" ", _comments.sub(" ", sql))):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            if depth == 0 and in_body:
+                in_body, after_body = False, True
+        elif depth > 0:
+            continue
+        elif token == ",":
+            after_body = False
+        elif token.upper() == "AS":
+            in_body = True
+        elif after_body and token.upper() in _statement_types:
+            # Other words, e.g. of a SEARCH or CYCLE clause, are skipped.
+            return _statement_types[token.upper()]
+    return "OTHER"
+
+
+def StatementType(sql):
+    """Classifies the statement sql by its leading keyword.
+
+    Returns one of SELECT, INSERT, UPDATE, DELETE, DDL, TRANSACTION or
+    OTHER. Results are memoized like Fingerprint's.
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    elif not isinstance(sql, str):
+        return "OTHER"
+    return _StatementType(sql)
@@ -1,22 +1,54 @@
 import logging
 import os
 import threading
+from urllib.parse import parse_qs, urlparse
 
 import prometheus_client
 from django.conf import settings
 from django.http import HttpResponse
-from prometheus_client import multiprocess
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from prometheus_client.exposition import choose_encoder, gzip_accepted
+
+from django_prometheus.conf import NAMESPACE, PROMETHEUS_LATENCY_BUCKETS
+from django_prometheus.multiprocess import GetMultiProcessDir, MultiProcessRegistry
+from django_prometheus.utils import PowersOf, Time, TimeSince
 
 try:
     # Python 2
-    from BaseHTTPServer import HTTPServer
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
 except ImportError:
     # Python 3
-    from http.server import HTTPServer
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
 
 
 logger = logging.getLogger(__name__)
 
+export_duration_seconds = prometheus_client.Histogram(
+    "django_metrics_export_duration_seconds",
+    "Histogram of the time spent serving scrapes by the standalone exporter.",
+    buckets=PROMETHEUS_LATENCY_BUCKETS,
+    namespace=NAMESPACE,
+)
+
+export_response_bytes = prometheus_client.Histogram(
+    "django_metrics_export_response_body_bytes",
+    "Histogram of the size of the pages served by the standalone exporter.",
+    buckets=PowersOf(2, 30),
+    namespace=NAMESPACE,
+)
+
+export_in_flight = prometheus_client.Gauge(
+    "django_metrics_export_in_flight",
+    "Number of scrapes being served by the standalone exporter.",
+    namespace=NAMESPACE,
+    # The files of live* gauges are removed when processes exit, see
+    # CompactMultiProcessFiles.
+    multiprocess_mode="livesum",
+)
+
 
 def SetupPrometheusEndpointOnPort(port, addr=""):
     """Exports Prometheus metrics on an HTTPServer running in its own thread.
@@ -45,6 +77,91 @@ def SetupPrometheusEndpointOnPort(port, addr=""):
     prometheus_client.start_http_server(port, addr=addr)
 
 
+class PrometheusMetricsHandler(BaseHTTPRequestHandler):
+    """Serves the metrics of the default registry on any path.
+
+    Like ExportToDjangoView, the page is serialized in the format
+    negotiated with the scraper, gzipped if the scraper accepts it, and
+    restricted to the samples named in the name[] parameters.
+    Connections are kept alive between scrapes, until they are idle for
+    longer than the server's request timeout.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def do_GET(self):
+        start = Time()
+        with export_in_flight.track_inprogress():
+            encoder, content_type = choose_encoder(self.headers.get("Accept"))
+            try:
+                metrics_page, gzipped = GenerateMetricsPage(
+                    prometheus_client.REGISTRY,
+                    encoder,
+                    content_type,
+                    compress=gzip_accepted(self.headers.get("Accept-Encoding", "")),
+                    names=parse_qs(urlparse(self.path).query).get("name[]"),
+                )
+            except Exception:
+                logger.exception("Failed to serve Prometheus /metrics/")
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(metrics_page)))
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            self.wfile.write(metrics_page)
+        export_response_bytes.observe(len(metrics_page))
+        export_duration_seconds.observe(TimeSince(start))
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class PrometheusEndpointHTTPServer(ThreadingMixIn, HTTPServer):
+    """An HTTPServer that serves each connection in its own thread.
+
+    At most max_connections connections are served at once: further
+    connections are closed as soon as they are accepted, so that slow
+    or hung scrapers can't exhaust the process' threads. Reads and
+    writes on a connection time out after timeout seconds.
+
+    Connections are kept alive between scrapes, and an idle connection
+    holds its slot until the client closes it or it times out, so
+    max_connections bounds the number of clients, not of scrapes in
+    progress.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class=PrometheusMetricsHandler, max_connections=8, timeout=10):
+        self.request_timeout = timeout
+        self._connections = threading.BoundedSemaphore(max_connections)
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        if not self._connections.acquire(blocking=False):
+            logger.warning("Too many connections to the Prometheus exporter, dropping one")
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connections.release()
+
+
 class PrometheusEndpointServer(threading.Thread):
     """A thread class that holds an http and makes it serve_forever()."""
 
@@ -56,7 +173,7 @@ class PrometheusEndpointServer(threading.Thread):
         self.httpd.serve_forever()
 
 
-def SetupPrometheusEndpointOnPortRange(port_range, addr=""):
+def SetupPrometheusEndpointOnPortRange(port_range, addr="", max_connections=8, timeout=10):
     """Like SetupPrometheusEndpointOnPort, but tries several ports.
 
     This is useful when you're running Django as a WSGI application
@@ -73,6 +190,10 @@ def SetupPrometheusEndpointOnPortRange(port_range, addr=""):
     Returns the port chosen (an `int`), or `None` if no port in the
     supplied range was available.
 
+    Each connection is served in its own thread, with at most
+    max_connections connections at once, and times out after timeout
+    seconds of inactivity. See PrometheusEndpointHTTPServer.
+
     The same caveats regarding autoreload apply. Do not use this when
     Django's autoreloader is active.
     """
@@ -83,7 +204,7 @@ def SetupPrometheusEndpointOnPortRange(port_range, addr=""):
     )
     for port in port_range:
         try:
-            httpd = HTTPServer((addr, port), prometheus_client.MetricsHandler)
+            httpd = PrometheusEndpointHTTPServer((addr, port), max_connections=max_connections, timeout=timeout)
         except OSError:
             # Python 2 raises socket.error, in Python 3 socket.error is an
             # alias for OSError
@@ -102,21 +223,107 @@ def SetupPrometheusExportsFromConfig():
     port = getattr(settings, "PROMETHEUS_METRICS_EXPORT_PORT", None)
     port_range = getattr(settings, "PROMETHEUS_METRICS_EXPORT_PORT_RANGE", None)
     addr = getattr(settings, "PROMETHEUS_METRICS_EXPORT_ADDRESS", "")
+    max_connections = getattr(settings, "PROMETHEUS_METRICS_EXPORT_MAX_CONNECTIONS", 8)
+    timeout = getattr(settings, "PROMETHEUS_METRICS_EXPORT_TIMEOUT", 10)
     if port_range:
-        SetupPrometheusEndpointOnPortRange(port_range, addr)
+        SetupPrometheusEndpointOnPortRange(port_range, addr, max_connections, timeout)
     elif port:
         SetupPrometheusEndpointOnPort(port, addr)
 
 
+# Pages smaller than this are not worth compressing.
+PROMETHEUS_EXPORT_GZIP_MIN_SIZE = 1024
+
+_multiprocess_registries = {}
+_payload_cache = {}
+_payload_cache_size = 64
+_export_lock = threading.Lock()
+
+
+def GetExportRegistry():
+    """Returns the registry that the metrics should be exported from.
+
+    In multiprocess mode, this is a MultiProcessRegistry, which is kept
+    between scrapes so that files that didn't change are not parsed and
+    merged again.
+    """
+    path = GetMultiProcessDir()
+    if not path:
+        return prometheus_client.REGISTRY
+    with _export_lock:
+        registry = _multiprocess_registries.get(path)
+        if registry is None:
+            registry = _multiprocess_registries[path] = MultiProcessRegistry(path=path)
+    return registry
+
+
+def GenerateMetricsPage(
+    registry,
+    encoder=prometheus_client.generate_latest,
+    content_type=None,
+    compress=False,
+    names=None,
+):
+    """Serializes the metrics of registry, possibly from a cache.
+
+    If names is not empty, only the samples with these names are
+    collected and serialized, like with the name[] parameter of
+    prometheus_client's handlers.
+
+    encoder and content_type are the serialization function and its
+    content type, as returned by prometheus_client's choose_encoder().
+    If compress is True, the page is gzipped if it is at least
+    PROMETHEUS_EXPORT_GZIP_MIN_SIZE bytes long (None disables
+    compression).
+
+    If PROMETHEUS_EXPORT_CACHE_TTL is set to a number of seconds, the
+    page is reused for that long instead of being generated for each
+    scrape.
+
+    Returns the page, and whether it was gzipped.
+    """
+    min_size = getattr(settings, "PROMETHEUS_EXPORT_GZIP_MIN_SIZE", PROMETHEUS_EXPORT_GZIP_MIN_SIZE)
+    compress = compress and min_size is not None
+    ttl = getattr(settings, "PROMETHEUS_EXPORT_CACHE_TTL", 0)
+    names = frozenset(names or ())
+    key = (registry, content_type, compress, names)
+    now = Time()
+    if ttl:
+        cached = _payload_cache.get(key)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+    metrics_page = encoder(registry.restricted_registry(names) if names else registry)
+    gzipped = compress and len(metrics_page) >= min_size
+    if gzipped:
+        metrics_page = compress_string(metrics_page)
+    if ttl:
+        if len(_payload_cache) >= _payload_cache_size:
+            # Scrapers may ask for any combination of names.
+            _payload_cache.clear()
+        _payload_cache[key] = (now, (metrics_page, gzipped))
+    return metrics_page, gzipped
+
+
 def ExportToDjangoView(request):
     """Exports /metrics as a Django view.
 
     You can use django_prometheus.urls to map /metrics to this view.
+
+    Like prometheus_client's own handlers, the view uses the OpenMetrics
+    format if the scraper accepts it, gzips the page if the scraper
+    accepts gzip encoding, and only exports the samples named in the
+    name[] parameters if there are any.
     """
-    if "PROMETHEUS_MULTIPROC_DIR" in os.environ or "prometheus_multiproc_dir" in os.environ:
-        registry = prometheus_client.CollectorRegistry()
-        multiprocess.MultiProcessCollector(registry)
-    else:
-        registry = prometheus_client.REGISTRY
-    metrics_page = prometheus_client.generate_latest(registry)
-    return HttpResponse(metrics_page, content_type=prometheus_client.CONTENT_TYPE_LATEST)
+    encoder, content_type = choose_encoder(request.headers.get("Accept"))
+    metrics_page, gzipped = GenerateMetricsPage(
+        GetExportRegistry(),
+        encoder,
+        content_type,
+        compress=gzip_accepted(request.headers.get("Accept-Encoding", "")),
+        names=request.GET.getlist("name[]"),
+    )
+    response = HttpResponse(metrics_page, content_type=content_type)
+    if gzipped:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return response
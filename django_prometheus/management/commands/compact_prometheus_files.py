@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_prometheus.multiprocess import CompactMultiProcessFiles
+
+
+class Command(BaseCommand):
+    help = "Merges the multiprocess metric files of dead processes into archive files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pid",
+            action="append",
+            dest="pids",
+            help="Only compact the files of this process, which must not be running. May be repeated.",
+        )
+        parser.add_argument(
+            "--path",
+            help="Directory of the metric files. Defaults to $PROMETHEUS_MULTIPROC_DIR.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            pids = CompactMultiProcessFiles(pids=options["pids"], path=options["path"])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        self.stdout.write(f"Compacted the files of {len(pids)} processes.")
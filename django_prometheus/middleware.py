@@ -1,7 +1,13 @@
+import weakref
+from types import MethodType
+
+from asgiref.sync import iscoroutinefunction
 from django.utils.deprecation import MiddlewareMixin
 from prometheus_client import Counter, Histogram
 
 from django_prometheus.conf import NAMESPACE, PROMETHEUS_LATENCY_BUCKETS
+from django_prometheus.request_stats import RequestDatabaseStats, SetRequestDatabaseStats
+from django_prometheus.shards import shardable
 from django_prometheus.utils import PowersOf, Time, TimeSince
 
 
@@ -15,7 +21,7 @@ class Metrics:
         return cls._instance
 
     def register_metric(self, metric_cls, name, documentation, labelnames=(), **kwargs):
-        return metric_cls(name, documentation, labelnames=labelnames, **kwargs)
+        return shardable(metric_cls)(name, documentation, labelnames=labelnames, **kwargs)
 
     def __init__(self, *args, **kwargs):
         self.register()
@@ -136,6 +142,22 @@ class Metrics:
             ["charset"],
             namespace=NAMESPACE,
         )
+        self.requests_db_queries = self.register_metric(
+            Histogram,
+            "django_http_request_db_queries",
+            "Histogram of the number of database queries per request, by view.",
+            ["view"],
+            buckets=PowersOf(2, 12),
+            namespace=NAMESPACE,
+        )
+        self.requests_db_seconds = self.register_metric(
+            Histogram,
+            "django_http_request_db_seconds",
+            "Histogram of the time spent in database queries per request, by view.",
+            ["view"],
+            buckets=PROMETHEUS_LATENCY_BUCKETS,
+            namespace=NAMESPACE,
+        )
         self.responses_streaming = self.register_metric(
             Counter,
             "django_http_responses_streaming_total",
@@ -159,7 +181,46 @@ class Metrics:
         )
 
 
-class PrometheusBeforeMiddleware(MiddlewareMixin):
+def _on_event_loop(method):
+    """Wraps a synchronous, non-blocking bound hook into a coroutine method."""
+
+    async def hook(self, *args, **kwargs):
+        return method(*args, **kwargs)
+
+    return MethodType(hook, method.__self__)
+
+
+class PrometheusMiddlewareMixin(MiddlewareMixin):
+    """A MiddlewareMixin whose hooks never leave the event loop under ASGI.
+
+    When serving async requests, MiddlewareMixin runs process_request
+    and process_response through sync_to_async, and Django does the
+    same for process_view and process_template_response. Each of these
+    is a hop to a thread. Our hooks only update metrics and never
+    block, so they are called from the event loop directly instead.
+
+    process_exception is always called synchronously by Django, from
+    the thread in which the exception was handled.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if iscoroutinefunction(self):
+            for name in ("process_view", "process_template_response"):
+                if hasattr(self, name):
+                    setattr(self, name, _on_event_loop(getattr(self, name)))
+
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, "process_request"):
+            response = self.process_request(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, "process_response"):
+            response = self.process_response(request, response)
+        return response
+
+
+class PrometheusBeforeMiddleware(PrometheusMiddlewareMixin):
     """Monitoring middleware that should run before other middlewares."""
 
     metrics_cls = Metrics
@@ -181,14 +242,37 @@ class PrometheusBeforeMiddleware(MiddlewareMixin):
         return response
 
 
-class PrometheusAfterMiddleware(MiddlewareMixin):
+# The PrometheusAfterMiddleware instances, whose label caches
+# ClearLabelCaches() empties.
+_after_middlewares = weakref.WeakSet()
+
+
+def ClearLabelCaches():
+    """Empties the label caches of the PrometheusAfterMiddleware instances.
+
+    Cached children that are removed from their metric, by its remove()
+    or clear() methods, would keep being updated without being exported.
+    Call this after removing children of the middleware's metrics.
+    """
+    for middleware in list(_after_middlewares):
+        middleware._label_cache.clear()
+
+
+class PrometheusAfterMiddleware(PrometheusMiddlewareMixin):
     """Monitoring middleware that should run after other middlewares."""
 
     metrics_cls = Metrics
 
+    # Maximum number of labelled children kept by label_metric(). When
+    # the cache is full it is emptied, so that label values with an
+    # unbounded cardinality (e.g. template names) can't leak memory.
+    label_cache_size = 1024
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.metrics = self.metrics_cls.get_instance()
+        self._label_cache = {}
+        _after_middlewares.add(self)
 
     def _transport(self, request):
         return "https" if request.is_secure() else "http"
@@ -210,7 +294,19 @@ class PrometheusAfterMiddleware(MiddlewareMixin):
         return m
 
     def label_metric(self, metric, request, response=None, **labels):
-        return metric.labels(**labels) if labels else metric
+        if not labels:
+            return metric
+        # metric.labels() validates the labels and takes the metric's
+        # lock on every call, so resolved children are cached, by label
+        # values converted to strings like metric.labels() does.
+        key = (metric, tuple((name, str(value)) for name, value in labels.items()))
+        child = self._label_cache.get(key)
+        if child is None:
+            child = metric.labels(**labels)
+            if len(self._label_cache) >= self.label_cache_size:
+                self._label_cache.clear()
+            self._label_cache[key] = child
+        return child
 
     def process_request(self, request):
         transport = self._transport(request)
@@ -224,6 +320,8 @@ class PrometheusAfterMiddleware(MiddlewareMixin):
 
         content_length = int(request.headers.get("content-length") or 0)
         self.label_metric(self.metrics.requests_body_bytes, request).observe(content_length)
+        request.prometheus_db_stats = RequestDatabaseStats()
+        SetRequestDatabaseStats(request.prometheus_db_stats)
         request.prometheus_after_middleware_event = Time()
 
     def _get_view_name(self, request):
@@ -239,6 +337,8 @@ class PrometheusAfterMiddleware(MiddlewareMixin):
         method = self._method(request)
         if hasattr(request, "resolver_match"):
             name = request.resolver_match.view_name or "<unnamed view>"
+            if hasattr(request, "prometheus_db_stats"):
+                request.prometheus_db_stats.view = name
             self.label_metric(
                 self.metrics.requests_by_view_transport_method,
                 request,
@@ -286,11 +386,16 @@ class PrometheusAfterMiddleware(MiddlewareMixin):
                 self.metrics.requests_latency_by_view_method,
                 request,
                 response,
-                view=self._get_view_name(request),
+                view=name,
                 method=request.method,
             ).observe(TimeSince(request.prometheus_after_middleware_event))
         else:
             self.label_metric(self.metrics.requests_unknown_latency, request, response).inc()
+        if hasattr(request, "prometheus_db_stats"):
+            SetRequestDatabaseStats(None)
+            stats = request.prometheus_db_stats
+            self.label_metric(self.metrics.requests_db_queries, request, response, view=name).observe(stats.queries)
+            self.label_metric(self.metrics.requests_db_seconds, request, response, view=name).observe(stats.duration)
         return response
 
     def process_exception(self, request, exception):
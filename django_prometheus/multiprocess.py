@@ -0,0 +1,387 @@
+"""Aggregation and compaction of the metric files of multiprocess mode.
+
+prometheus_client's MultiProcessCollector reads, parses and merges
+every file of PROMETHEUS_MULTIPROC_DIR each time it is collected. The
+collector defined here keeps the parsed content of each file and the
+merged metric families between collections, so that only the files
+that changed are parsed again, and only the families they contain are
+merged again.
+
+Each process writes its own files, which are left behind when it
+exits. CompactMultiProcessFiles merges the files of dead processes
+into a single archive file per metric type. Only the collector defined
+here is synchronized with compactions, and knows which process files
+an archive already contains; prometheus_client's MultiProcessCollector
+counts the values of the compacted processes twice while their files
+are being compacted.
+
+This relies on private parts of prometheus_client (the file parsing
+and merging of MultiProcessCollector, and MmapedDict), which were
+verified against prometheus_client 0.16 to 0.26.
+"""
+
+import contextlib
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.metrics_core import Metric
+from prometheus_client.mmap_dict import MmapedDict
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, compaction is then not synchronized
+    # with collections.
+    fcntl = None
+
+ARCHIVE_ID = "archive"
+
+# Ends the list of the processes merged into an archive, which follows
+# the part of the archive that metric readers use.
+_MANIFEST_MAGIC = b"DJPMPIDS"
+_MANIFEST_TRAILER = struct.Struct("<i8s")
+
+# Gauges in these modes can be merged across processes without losing
+# information. Other gauges are either removed when their process dies
+# (live* modes) or need to be kept per process.
+_COMPACTABLE_GAUGE_MODES = ("sum", "min", "max")
+
+
+def GetMultiProcessDir():
+    """Returns the directory of the multiprocess metric files, or None."""
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def ReadMetricFile(filename):
+    """Returns the used part of a metric file, as bytes.
+
+    Metric files are preallocated, and start with the number of bytes
+    actually in use. This reads them the same way as prometheus_client.
+    """
+    with open(filename, "rb") as f:
+        data = f.read(mmap.PAGESIZE)
+        used = struct.unpack_from("i", data, 0)[0] if len(data) >= 4 else 0
+        if used > len(data):
+            data += f.read(used - len(data))
+    return data[:used]
+
+
+def MetricFileSignature(filename):
+    """Returns the number of used bytes of a metric file and a digest of
+    them, which change when any value of the file changes.
+
+    Values are updated in place, so the whole used part has to be read,
+    but only the signature needs to be kept.
+    """
+    data = ReadMetricFile(filename)
+    return len(data), hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _ParseFilename(filename):
+    """Returns the archive a metric file is merged into and its process
+    identifier, or None if it isn't a process file."""
+    parts = os.path.basename(filename)[: -len(".db")].split("_")
+    pid = parts[-1]
+    if pid == ARCHIVE_ID or len(parts) not in (2, 3):
+        return None
+    archive = os.path.join(os.path.dirname(filename), "_".join([*parts[:-1], ARCHIVE_ID]) + ".db")
+    return archive, pid
+
+
+def _ReadManifest(archive):
+    """Returns the identifiers of the processes merged into archive."""
+    try:
+        with open(archive, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size < _MANIFEST_TRAILER.size:
+                return set()
+            f.seek(size - _MANIFEST_TRAILER.size)
+            length, magic = _MANIFEST_TRAILER.unpack(f.read(_MANIFEST_TRAILER.size))
+            if magic != _MANIFEST_MAGIC or not 0 <= length <= size - _MANIFEST_TRAILER.size:
+                return set()
+            f.seek(size - _MANIFEST_TRAILER.size - length)
+            return set(json.loads(f.read(length)))
+    except FileNotFoundError:
+        return set()
+
+
+def _DropManifest(archive):
+    """Removes the list of merged processes from the end of archive."""
+    with open(archive, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size < _MANIFEST_TRAILER.size:
+            return
+        f.seek(size - _MANIFEST_TRAILER.size)
+        length, magic = _MANIFEST_TRAILER.unpack(f.read(_MANIFEST_TRAILER.size))
+        if magic == _MANIFEST_MAGIC:
+            f.truncate(size - _MANIFEST_TRAILER.size - length)
+
+
+@contextlib.contextmanager
+def _FilesLock(path, exclusive):
+    """Synchronizes compactions of path with collections of its files."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(path, "compaction.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class IncrementalMultiProcessCollector:
+    """A drop-in replacement for MultiProcessCollector that caches its work.
+
+    The signature of each file, its size and a digest of its content,
+    is compared to the one it had during the previous collection; the
+    modification time can't be used for this, as the kernel doesn't
+    update it on every write to a mmap'ed file. Unchanged files are not
+    parsed again, and metric families that only appear in unchanged
+    files are not merged again.
+    """
+
+    def __init__(self, registry, path=None):
+        path = path or GetMultiProcessDir()
+        if not path or not os.path.isdir(path):
+            raise ValueError("env PROMETHEUS_MULTIPROC_DIR is not set or not a directory")
+        self._path = path
+        self._lock = threading.Lock()
+        # Maps filenames to (signature, {metric name: Metric}).
+        self._files = {}
+        # Maps metric names to merged Metrics.
+        self._merged = {}
+        # Names of the metrics that changed since they were last merged.
+        self._dirty = set()
+        if registry:
+            registry.register(self)
+
+    def _refresh(self):
+        """Parses new and changed files, returns the changed metric names."""
+        changed = set()
+        filenames = set(glob.glob(os.path.join(self._path, "*.db")))
+        # Files that a compaction merged into an archive, but didn't get
+        # to remove, are ignored.
+        manifests = {}
+        for filename in list(filenames):
+            parsed = _ParseFilename(filename)
+            if parsed is None:
+                continue
+            archive, pid = parsed
+            if archive not in manifests:
+                manifests[archive] = _ReadManifest(archive) if archive in filenames else set()
+            if pid in manifests[archive]:
+                filenames.discard(filename)
+        for filename in set(self._files) - filenames:
+            changed.update(self._files.pop(filename)[1])
+        for filename in filenames:
+            try:
+                signature = MetricFileSignature(filename)
+            except FileNotFoundError:
+                # Files for 'live*' gauges are removed when processes die.
+                if filename in self._files:
+                    changed.update(self._files.pop(filename)[1])
+                continue
+            cached = self._files.get(filename)
+            if cached is not None and cached[0] == signature:
+                continue
+            try:
+                metrics = MultiProcessCollector._read_metrics([filename])
+            except FileNotFoundError:
+                continue
+            if cached is not None:
+                changed.update(cached[1])
+            changed.update(metrics)
+            self._files[filename] = (signature, metrics)
+        return changed
+
+    def _merge(self, name):
+        """Merges the samples of the metric called name from all files."""
+        merged = None
+        for _, metrics in self._files.values():
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            if merged is None:
+                merged = Metric(metric.name, metric.documentation, metric.type)
+                if hasattr(metric, "_multiprocess_mode"):
+                    merged._multiprocess_mode = metric._multiprocess_mode
+            merged.samples.extend(metric.samples)
+        if merged is None:
+            return None
+        return list(MultiProcessCollector._accumulate_metrics({name: merged}, True))[0]
+
+    def collect(self, names=None):
+        """Returns the merged metrics.
+
+        If names is given, only the metrics that may have samples with
+        one of these names are merged and returned. Other metrics that
+        changed are merged when they are next requested.
+        """
+        with self._lock, _FilesLock(self._path, exclusive=False):
+            self._dirty.update(self._refresh())
+            if names is None:
+                wanted = set(self._dirty)
+            else:
+                wanted = {name for name in self._dirty if _MayHaveSamples(name, names)}
+            for name in wanted:
+                metric = self._merge(name)
+                if metric is None:
+                    self._merged.pop(name, None)
+                else:
+                    self._merged[name] = metric
+            self._dirty -= wanted
+            if names is None:
+                return list(self._merged.values())
+            return [metric for name, metric in self._merged.items() if _MayHaveSamples(name, names)]
+
+
+def _MayHaveSamples(metric_name, sample_names):
+    """Whether the metric called metric_name may have one of sample_names."""
+    prefix = metric_name + "_"
+    return any(name == metric_name or name.startswith(prefix) for name in sample_names)
+
+
+class _RestrictedMultiProcessRegistry:
+    def __init__(self, collector, names):
+        self._collector = collector
+        self._names = set(names)
+
+    def collect(self):
+        for metric in self._collector.collect(self._names):
+            samples = [sample for sample in metric.samples if sample.name in self._names]
+            if samples:
+                restricted = Metric(metric.name, metric.documentation, metric.type)
+                restricted.samples = samples
+                yield restricted
+
+
+class MultiProcessRegistry(CollectorRegistry):
+    """A registry holding an IncrementalMultiProcessCollector.
+
+    Unlike prometheus_client's, its restricted registries only merge the
+    metrics that were requested.
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.collector = IncrementalMultiProcessCollector(self, path=path)
+
+    def restricted_registry(self, names):
+        return _RestrictedMultiProcessRegistry(self.collector, names)
+
+
+def _ProcessIsAlive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        # Not a pid, e.g. a uwsgi worker id: can't tell.
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _WriteArchive(filename, files, pids):
+    """Merges files into the archive filename, which may already exist.
+
+    pids, the identifiers of the processes merged into the archive, are
+    written after the part of the file that metric readers use, so that
+    the archive and this list are replaced at once.
+    """
+    if os.path.exists(filename):
+        files = [filename, *files]
+    metrics = MultiProcessCollector._accumulate_metrics(MultiProcessCollector._read_metrics(files), False)
+    tmp_filename = filename + ".tmp"
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    archive = MmapedDict(tmp_filename)
+    try:
+        for metric in metrics:
+            for sample in metric.samples:
+                labels = {k: v for k, v in sample.labels.items() if k != "pid"}
+                key = json.dumps([metric.name, sample.name, labels, metric.documentation], sort_keys=True)
+                try:
+                    archive.write_value(key, sample.value, 0.0)
+                except TypeError:
+                    # prometheus_client < 0.17 doesn't store timestamps.
+                    archive.write_value(key, sample.value)
+    finally:
+        archive.close()
+    with open(tmp_filename, "ab") as f:
+        manifest = json.dumps(sorted(pids)).encode()
+        f.write(manifest + _MANIFEST_TRAILER.pack(len(manifest), _MANIFEST_MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def CompactMultiProcessFiles(pids=None, path=None):
+    """Merges the metric files of dead processes into archive files.
+
+    pids are the identifiers of the processes whose files should be
+    compacted. Processes must not be running anymore, which is the
+    case in gunicorn's child_exit hook. If pids is None, the files of
+    all the processes that are not running anymore are compacted.
+
+    Counters, histograms, summaries and gauges in the sum, min and max
+    modes are merged into one archive file per type (and mode), e.g.
+    counter_archive.db. Counters only ever grow, and the archive files
+    are regular metric files that any MultiProcessCollector can read.
+    Files of live* gauges are removed, like mark_process_dead does.
+    Other gauges are left alone.
+
+    The identifiers of the merged processes are stored in the archive,
+    which replaces the previous one atomically. If the compaction is
+    interrupted before the files it merged are removed, they are
+    ignored by IncrementalMultiProcessCollector, and removed by the next
+    compaction. Other readers of the files, like prometheus_client's
+    MultiProcessCollector, count them twice until then.
+
+    Returns the sorted list of the compacted process identifiers.
+    """
+    path = path or GetMultiProcessDir()
+    if not path or not os.path.isdir(path):
+        raise ValueError("env PROMETHEUS_MULTIPROC_DIR is not set or not a directory")
+    pids = None if pids is None else {str(pid) for pid in pids}
+    with _FilesLock(path, exclusive=True):
+        # Maps archive filenames to the files that should be merged in them.
+        archives = {}
+        dead = set()
+        for filename in glob.glob(os.path.join(path, "*.db")):
+            parsed = _ParseFilename(filename)
+            if parsed is None:
+                continue
+            archive, pid = parsed
+            if pids is None and _ProcessIsAlive(pid):
+                continue
+            if pids is not None and pid not in pids:
+                continue
+            dead.add(pid)
+            parts = os.path.basename(filename).split("_")
+            if parts[0] == "gauge" and parts[1] not in _COMPACTABLE_GAUGE_MODES:
+                continue
+            archives.setdefault(archive, []).append((pid, filename))
+        for archive, entries in archives.items():
+            merged = _ReadManifest(archive)
+            files = [filename for pid, filename in entries if pid not in merged]
+            if files:
+                _WriteArchive(archive, files, {pid for pid, _ in entries})
+            for _, filename in entries:
+                os.remove(filename)
+            # Once their files are gone, listing the processes would only
+            # hide the files of new processes reusing their identifiers.
+            _DropManifest(archive)
+        for pid in dead:
+            mark_process_dead(pid, path)
+    return sorted(dead)
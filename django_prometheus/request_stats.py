@@ -0,0 +1,39 @@
+"""Database activity of the request being served.
+
+This is kept apart from django_prometheus.db, so that the middleware
+can use it without registering the database metrics.
+"""
+
+from contextvars import ContextVar
+
+
+class RequestDatabaseStats:
+    """Accumulates the database activity of the request being served.
+
+    PrometheusAfterMiddleware creates one per request and makes it
+    current with SetRequestDatabaseStats(). Cursors then add each query
+    to the current stats, if any. The stats are carried in a context
+    variable, so they follow the request into the threads that
+    sync_to_async runs synchronous code in.
+    """
+
+    __slots__ = ("queries", "duration", "view")
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        # The name of the view, once it is resolved.
+        self.view = None
+
+
+_request_stats = ContextVar("django_prometheus_request_db_stats", default=None)
+
+
+def SetRequestDatabaseStats(stats):
+    """Makes stats (a RequestDatabaseStats or None) current."""
+    _request_stats.set(stats)
+
+
+def GetRequestDatabaseStats():
+    """Returns the current RequestDatabaseStats, or None."""
+    return _request_stats.get()
@@ -0,0 +1,264 @@
+"""Counters and histograms that accumulate in per-thread shards.
+
+Every update of a prometheus_client metric takes the mutex of the
+labelled child it updates. When many threads serve requests, these
+mutexes are contended. Sharded metrics instead accumulate updates in a
+dict owned by the updating thread, without taking any lock, and only
+merge the shards of all threads when the metric is collected.
+
+Only the owning thread writes to a shard, so no update is lost.
+Collections copy each shard, which is atomic with the GIL and on
+free-threaded Python alike, where dicts and lists lock themselves
+during a copy. A collection may thus see the bucket of an observation
+that is in progress, but not yet its sum, which the next collection
+catches up with.
+
+Sharding is enabled by setting PROMETHEUS_SHARDED_METRICS = True. It
+is ignored in multiprocess mode, where the values have to be written to
+the shared files as they are updated.
+"""
+
+import abc
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+import prometheus_client
+from prometheus_client import REGISTRY
+from prometheus_client import metrics as prometheus_metrics
+from prometheus_client.metrics_core import CounterMetricFamily, HistogramMetricFamily
+from prometheus_client.samples import Sample
+from prometheus_client.utils import floatToGoString
+
+from django_prometheus.conf import PROMETHEUS_SHARDED_METRICS
+from django_prometheus.utils import Time, TimeSince
+
+
+class _Timer:
+    """Observes the time spent in a with block into a histogram."""
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = Time()
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self._histogram.observe(max(TimeSince(self._start), 0))
+
+
+def _UseCreated():
+    # Disabled by PROMETHEUS_DISABLE_CREATED_SERIES, like in prometheus_client.
+    return getattr(prometheus_metrics, "_use_created", True)
+
+
+class ShardedMetric(abc.ABC):
+    """Base class of the sharded metrics.
+
+    The constructor accepts the same arguments as the prometheus_client
+    metric it replaces. A prototype of that metric, which isn't
+    registered, is used to validate them and to describe the metric.
+
+    Each thread updates its own shard, a dict mapping label values to
+    the thread's accumulated value. Only the owning thread writes to a
+    shard, and collect() only reads copies of it. Shards of threads that
+    have exited are folded into self._retired so their values are kept.
+
+    Subclasses implement _merge, which adds up the values of two shards,
+    and collect.
+    """
+
+    metric_cls = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, **kwargs):
+        self._prototype = self.metric_cls(name, documentation, labelnames=labelnames, registry=None, **kwargs)
+        self._name = self._prototype._name
+        self._documentation = documentation
+        self._labelnames = self._prototype._labelnames
+        self._unit = self._prototype._unit
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._children = {}
+        if not self._labelnames:
+            self._children[()] = self._child_cls(self, ())
+        if registry:
+            registry.register(self)
+
+    def labels(self, *labelvalues, **labelkwargs):
+        if not self._labelnames:
+            raise ValueError(f"No label names were set when constructing {self._name}")
+        if labelvalues and labelkwargs:
+            raise ValueError("Can't pass both *args and **kwargs")
+        if labelkwargs:
+            if sorted(labelkwargs) != sorted(self._labelnames):
+                raise ValueError("Incorrect label names")
+            key = tuple(str(labelkwargs[label]) for label in self._labelnames)
+        else:
+            if len(labelvalues) != len(self._labelnames):
+                raise ValueError("Incorrect label count")
+            key = tuple(str(value) for value in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child_cls(self, key))
+        return child
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+            return shard
+
+    @abc.abstractmethod
+    def _merge(self, total, value):
+        """Returns the sum of total, which may be None, and value, without
+        modifying value, which its thread may be updating."""
+
+    @abc.abstractmethod
+    def collect(self):
+        pass
+
+    def _totals(self):
+        """Returns the children and the values of all threads, merged by
+        label values."""
+        with self._lock:
+            live = []
+            for thread_ref, shard in self._shards:
+                thread = thread_ref()
+                if thread is not None and thread.is_alive():
+                    live.append((thread_ref, shard))
+                else:
+                    for key, value in shard.items():
+                        self._retired[key] = self._merge(self._retired.get(key), value)
+            self._shards = live
+            totals = dict(self._retired)
+            for _, shard in live:
+                for key, value in shard.copy().items():
+                    totals[key] = self._merge(totals.get(key), value)
+            children = list(self._children.items())
+        return children, totals
+
+    def describe(self):
+        return self._prototype.describe()
+
+
+class _ShardedCounterChild:
+    def __init__(self, parent, key):
+        self._parent = parent
+        self._key = key
+        self.created = time.time()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented by non-negative amounts.")
+        shard = self._parent._shard()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+
+class ShardedCounter(ShardedMetric):
+    """A sharded replacement for prometheus_client.Counter."""
+
+    metric_cls = prometheus_client.Counter
+    _child_cls = _ShardedCounterChild
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def _merge(self, total, value):
+        return (total or 0) + value
+
+    def collect(self):
+        family = CounterMetricFamily(self._name, self._documentation, labels=self._labelnames, unit=self._unit)
+        children, totals = self._totals()
+        use_created = _UseCreated()
+        for key, child in children:
+            family.add_metric(key, totals.get(key, 0), created=child.created if use_created else None)
+        return [family]
+
+
+class _ShardedHistogramChild:
+    def __init__(self, parent, key):
+        self._parent = parent
+        self._key = key
+        self.created = time.time()
+
+    def observe(self, amount):
+        parent = self._parent
+        bucket = bisect_left(parent._upper_bounds, amount)
+        shard = parent._shard()
+        values = shard.get(self._key)
+        if values is None:
+            # One count per bucket, followed by the sum.
+            values = shard[self._key] = [0] * (len(parent._upper_bounds) + 1)
+        values[bucket] += 1
+        values[-1] += amount
+
+    def time(self):
+        return _Timer(self)
+
+
+class ShardedHistogram(ShardedMetric):
+    """A sharded replacement for prometheus_client.Histogram."""
+
+    metric_cls = prometheus_client.Histogram
+    _child_cls = _ShardedHistogramChild
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upper_bounds = self._prototype._upper_bounds
+
+    def observe(self, amount):
+        self._children[()].observe(amount)
+
+    def time(self):
+        return _Timer(self)
+
+    def _merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def collect(self):
+        family = HistogramMetricFamily(self._name, self._documentation, labels=self._labelnames, unit=self._unit)
+        children, totals = self._totals()
+        use_created = _UseCreated()
+        for key, child in children:
+            values = totals.get(key) or [0] * (len(self._upper_bounds) + 1)
+            buckets = []
+            count = 0
+            for bound, bucket in zip(self._upper_bounds, values):
+                count += bucket
+                buckets.append((floatToGoString(bound), count))
+            family.add_metric(key, buckets, values[-1])
+            if use_created:
+                # HistogramMetricFamily.add_metric doesn't take created.
+                labels = dict(zip(self._labelnames, key))
+                family.samples.append(Sample(f"{self._name}_created", labels, child.created))
+        return [family]
+
+
+SHARDED_METRICS = {
+    prometheus_client.Counter: ShardedCounter,
+    prometheus_client.Histogram: ShardedHistogram,
+}
+
+
+def shardable(metric_cls):
+    """Returns the class to create a metric of type metric_cls with.
+
+    This is the sharded implementation of metric_cls if sharding is
+    enabled and supported for this type, and metric_cls otherwise.
+    """
+    if not PROMETHEUS_SHARDED_METRICS:
+        return metric_cls
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ or "prometheus_multiproc_dir" in os.environ:
+        return metric_cls
+    return SHARDED_METRICS.get(metric_cls, metric_cls)
@@ -0,0 +1,86 @@
+"""Capture of the latest slow queries.
+
+When PROMETHEUS_DB_SLOW_QUERY_THRESHOLD is set, the cursor wrappers
+record the queries that take at least that many seconds into a ring
+buffer, which SlowQueriesView serves to staff users. This shows which
+statements caused a spike of django_db_query_duration_seconds without
+enabling query logging.
+
+This is kept apart from django_prometheus.db, so that the URLs can
+serve the view without registering the database metrics.
+"""
+
+import random
+import time
+from collections import deque
+
+from django.http import Http404, HttpResponseForbidden, JsonResponse
+
+from django_prometheus.conf import (
+    PROMETHEUS_DB_SLOW_QUERY_BUFFER_SIZE,
+    PROMETHEUS_DB_SLOW_QUERY_SAMPLE_RATE,
+    PROMETHEUS_DB_SLOW_QUERY_THRESHOLD,
+)
+
+
+class SlowQueryLog:
+    """A ring buffer of the latest queries slower than threshold seconds.
+
+    Only a sample_rate fraction of the slow queries are recorded, which
+    bounds the cost of fingerprinting them. Appending to and copying the
+    buffer are atomic, so no lock is taken.
+    """
+
+    def __init__(self, threshold, size=100, sample_rate=1.0):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self._entries = deque(maxlen=size)
+
+    def observe(self, alias, vendor, query, duration, view=None):
+        if duration < self.threshold:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        # Queries are only observed by the cursors of django_prometheus.db,
+        # which is then already imported.
+        from django_prometheus.db.sql import Fingerprint
+
+        self._entries.append(
+            {
+                "time": time.time(),
+                "alias": alias,
+                "vendor": vendor,
+                "view": view,
+                "fingerprint": Fingerprint(query),
+                "duration": duration,
+            },
+        )
+
+    def entries(self):
+        """Returns the recorded queries, oldest first."""
+        return list(self._entries)
+
+
+slow_query_log = None
+if PROMETHEUS_DB_SLOW_QUERY_THRESHOLD is not None:
+    slow_query_log = SlowQueryLog(
+        PROMETHEUS_DB_SLOW_QUERY_THRESHOLD,
+        size=PROMETHEUS_DB_SLOW_QUERY_BUFFER_SIZE,
+        sample_rate=PROMETHEUS_DB_SLOW_QUERY_SAMPLE_RATE,
+    )
+
+
+def SlowQueriesView(request):
+    """Serves the latest slow queries as JSON, slowest first.
+
+    Only active staff users can see the queries, which may reveal the
+    structure of the database. The view is not found if the capture of
+    slow queries is disabled.
+    """
+    if slow_query_log is None:
+        raise Http404("The capture of slow queries is disabled.")
+    user = getattr(request, "user", None)
+    if not (user is not None and user.is_active and user.is_staff):
+        return HttpResponseForbidden()
+    queries = sorted(slow_query_log.entries(), key=lambda entry: entry["duration"], reverse=True)
+    return JsonResponse({"threshold": slow_query_log.threshold, "queries": queries})
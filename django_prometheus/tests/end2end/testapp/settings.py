@@ -93,6 +93,11 @@ DATABASES = {
         "ENGINE": "django_prometheus.db.backends.sqlite3",
         "NAME": "test_db_2.sqlite3",
     },
+    "test_db_wrapped": {
+        "ENGINE": "django_prometheus.db.backends.wrapped",
+        "NAME": "test_db_wrapped.sqlite3",
+        "OPTIONS": {"WRAPPED_ENGINE": "django.db.backends.sqlite3"},
+    },
 }
 
 # Caches
@@ -127,6 +132,15 @@ CACHES = {
         "BACKEND": "django_prometheus.cache.backends.redis.RedisCache",
         "LOCATION": "redis://127.0.0.1:6379/1",
     },
+    "wrapped_locmem": {
+        "BACKEND": "django_prometheus.cache.backends.wrapped.InstrumentedCache",
+        "LOCATION": "wrapped_locmem",
+        "OPTIONS": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    "wrapped_dummy": {
+        "BACKEND": "django_prometheus.cache.backends.wrapped.InstrumentedCache",
+        "OPTIONS": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+    },
     # Fake redis config emulated stopped service
     "stopped_redis": {
         "BACKEND": "django_prometheus.cache.backends.redis.RedisCache",
@@ -1,8 +1,21 @@
+import hashlib
+
 import pytest
-from django.core.cache import caches
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
 from redis import RedisError
 
-from django_prometheus.testutils import assert_metric_equal, get_metric
+from django_prometheus.cache import metrics
+from django_prometheus.cache.backends.wrapped import InstrumentedCache
+from django_prometheus.cache.common import ObserveValueSizes
+from django_prometheus.testutils import (
+    assert_metric_compare,
+    assert_metric_diff,
+    assert_metric_equal,
+    get_metric,
+    save_registry,
+)
 
 _SUPPORTED_CACHES = [
     "memcached.PyLibMCCache",
@@ -11,6 +24,7 @@ _SUPPORTED_CACHES = [
     "locmem",
     "native_redis",
     "redis",
+    "wrapped_locmem",
 ]
 
 
@@ -39,6 +53,145 @@ class TestCachesMetrics:
             backend=backend,
         )
 
+    @pytest.mark.parametrize("supported_cache", _SUPPORTED_CACHES)
+    def test_operations(self, supported_cache):
+        tested_cache = caches[supported_cache]
+        backend = supported_cache.split(".")[0]
+        registry = save_registry()
+        tested_cache.set("counter", 1)
+        assert tested_cache.add("counter", 2) is False
+        assert tested_cache.incr("counter") == 2
+        assert tested_cache.decr("counter", 2) == 0
+        assert tested_cache.get_or_set("counter", 3) == 0
+        assert tested_cache.has_key("counter")
+        tested_cache.touch("counter", 60)
+        tested_cache.set_many({"foo": 1, "bar": 2})
+        assert tested_cache.get_many(["foo", "bar"]) == {"foo": 1, "bar": 2}
+        tested_cache.delete_many(["foo", "bar"])
+        assert tested_cache.delete("counter")
+
+        # Operations called by others, like add by get_or_set and incr by
+        # decr, are only observed once.
+        for operation in (
+            "set",
+            "add",
+            "incr",
+            "decr",
+            "get_or_set",
+            "has_key",
+            "touch",
+            "set_many",
+            "get_many",
+            "delete_many",
+            "delete",
+        ):
+            assert_metric_diff(registry, 1, "django_cache_operations_total", backend=backend, operation=operation)
+            assert_metric_diff(
+                registry, 1, "django_cache_operation_duration_seconds_count", backend=backend, operation=operation
+            )
+
+    @pytest.mark.parametrize("supported_cache", _SUPPORTED_CACHES)
+    def test_get_many(self, supported_cache):
+        tested_cache = caches[supported_cache]
+        backend = supported_cache.split(".")[0]
+        registry = save_registry()
+        tested_cache.set_many({"many1": 1, "many2": 2})
+        assert tested_cache.get_many(key for key in ("many1", "many2", "many3")) == {"many1": 1, "many2": 2}
+        assert_metric_diff(registry, 3, "django_cache_get_total", backend=backend)
+        assert_metric_diff(registry, 2, "django_cache_get_hits_total", backend=backend)
+        assert_metric_diff(registry, 1, "django_cache_get_misses_total", backend=backend)
+        assert_metric_diff(registry, 1, "django_cache_batch_size_count", backend=backend, operation="get_many")
+        assert_metric_diff(registry, 3, "django_cache_batch_size_sum", backend=backend, operation="get_many")
+        assert_metric_diff(registry, 2, "django_cache_batch_size_sum", backend=backend, operation="set_many")
+
+    def test_wrapped_cache(self):
+        tested_cache = caches["wrapped_dummy"]
+        registry = save_registry()
+        tested_cache.set("foo", "bar")
+        assert tested_cache.get("foo", "default") == "default"
+        assert tested_cache.make_key("foo") == ":1:foo"
+        assert_metric_diff(registry, 1, "django_cache_operations_total", backend="wrapped_dummy", operation="set")
+        assert_metric_diff(registry, 1, "django_cache_get_misses_total", backend="wrapped_dummy")
+
+        with pytest.raises(InvalidCacheBackendError):
+            InstrumentedCache("", {"OPTIONS": {}})
+
+    def test_wrapped_cache_alias(self, settings):
+        options = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+        backend = "django_prometheus.cache.backends.wrapped.InstrumentedCache"
+        settings.CACHES = {"first": {"BACKEND": backend, "OPTIONS": options}}
+        assert caches.create_connection("first").prometheus_backend == "first"
+
+        settings.CACHES = {**settings.CACHES, "second": {"BACKEND": backend, "OPTIONS": options}}
+        with pytest.raises(InvalidCacheBackendError):
+            caches.create_connection("first")
+
+        options["ALIAS"] = "shared"
+        assert caches.create_connection("second").prometheus_backend == "shared"
+
+    def test_value_sizes(self):
+        registry = save_registry()
+        value = "x" * 2000
+        redis_cache = RedisCache("redis://127.0.0.1:6379/0", {})
+        assert ObserveValueSizes(redis_cache, "sizes_redis")
+        serializer = redis_cache._cache._serializer
+        assert serializer.loads(serializer.dumps(value)) == value
+        assert serializer.loads(serializer.dumps(12)) == 12
+        assert_metric_diff(registry, 2, "django_cache_set_value_size_bytes_count", backend="sizes_redis")
+        assert_metric_diff(registry, 1, "django_cache_set_value_size_bytes_bucket", le="2.0", backend="sizes_redis")
+        assert_metric_diff(registry, 1, "django_cache_get_value_size_bytes_bucket", le="1024.0", backend="sizes_redis")
+        assert_metric_compare(
+            registry,
+            lambda a, b: b - (a or 0) > 2000,
+            "django_cache_get_value_size_bytes_sum",
+            backend="sizes_redis",
+        )
+
+        memcached_cache = PyMemcacheCache("127.0.0.1:11211", {})
+        assert ObserveValueSizes(memcached_cache, "sizes_memcached")
+        serde = memcached_cache._options["serde"]
+        assert serde.deserialize("key", *serde.serialize("key", {"value": value})) == {"value": value}
+        assert_metric_diff(registry, 1, "django_cache_set_value_size_bytes_count", backend="sizes_memcached")
+        assert_metric_diff(registry, 1, "django_cache_get_value_size_bytes_count", backend="sizes_memcached")
+
+        assert not ObserveValueSizes(caches["locmem"], "sizes_locmem")
+
+    def test_hot_keys(self, monkeypatch):
+        def digest(key):
+            return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+        hot_keys = metrics.HotKeys(2, registry=None)
+        monkeypatch.setattr(metrics, "hot_keys", hot_keys)
+        tested_cache = caches["locmem"]
+        tested_cache.set("hot", 1)
+        for _ in range(3):
+            tested_cache.get("hot")
+        # get_or_set's own get and add are not counted.
+        tested_cache.get_or_set("warm", 1)
+        tested_cache.get_many(["hot", "cold"])
+        (accesses,) = hot_keys.collect()
+        # Keys are only exported as digests. cold replaced warm, and only
+        # counts its own accesses.
+        assert [(s.name, s.labels, s.value) for s in accesses.samples] == [
+            ("django_cache_hot_key_accesses_total", {"backend": "locmem", "key": digest("hot")}, 5),
+            ("django_cache_hot_key_accesses_total", {"backend": "locmem", "key": digest("cold")}, 1),
+        ]
+
+        hot_keys = metrics.HotKeys(2, key_function=lambda key: key.partition(":")[0] or None, registry=None)
+        hot_keys.observe("locmem", ["user:1", "user:2", ":anonymous"])
+        assert [(s.labels["key"], s.value) for s in hot_keys.collect()[0].samples] == [("user", 2)]
+
+        hot_keys = metrics.HotKeys(2, key_function=str, label_length=20, registry=None)
+        hot_keys.observe("locmem", ["x" * 100])
+        assert len(hot_keys.collect()[0].samples[0].labels["key"]) == 20
+
+    def test_hot_keys_sampling(self, monkeypatch):
+        hot_keys = metrics.HotKeys(2, key_function=str, sample_rate=0.5, registry=None)
+        for value in (0.2, 0.7, 0.4):
+            monkeypatch.setattr(metrics.random, "random", lambda value=value: value)
+            hot_keys.observe("locmem", ["hot"])
+        assert [(s.labels["key"], s.value) for s in hot_keys.collect()[0].samples] == [("hot", 4)]
+
     def test_redis_cache_fail(self):
         # Note: test use fake service config (like if server was stopped)
         supported_cache = "redis"
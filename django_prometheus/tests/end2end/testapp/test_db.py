@@ -1,7 +1,14 @@
+import sqlite3
+
 import pytest
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.db import connections
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connections, transaction
 
+from django_prometheus import slow_queries
+from django_prometheus.db import common, metrics
+from django_prometheus.db.backends.wrapped import base as wrapped
 from django_prometheus.testutils import (
     assert_metric_compare,
     assert_metric_diff,
@@ -9,6 +16,7 @@ from django_prometheus.testutils import (
     get_metric,
     save_registry,
 )
+from testapp.models import Lawn
 
 # @pytest.fixture(autouse=True)
 # def enable_db_access_for_all_tests(db):
@@ -99,6 +107,348 @@ class TestDbMetrics(BaseDBTest):
             vendor="sqlite",
         )
 
+    def test_execute_many_iterator(self):
+        registry = save_registry()
+        labels = {"alias": "test_db_1", "vendor": "sqlite"}
+        cursor = connections["test_db_1"].cursor()
+        consumed = []
+
+        def rows():
+            for location in ("Paris", "New York", "Berlin"):
+                consumed.append(location)
+                yield (location,)
+
+        cursor.executemany("INSERT INTO testapp_lawn(location) VALUES (%s)", rows())
+        assert consumed == ["Paris", "New York", "Berlin"]
+        assert_metric_diff(registry, 3, "django_db_execute_many_total", **labels)
+        assert_metric_diff(registry, 3, "django_db_execute_total", **labels)
+        assert_metric_diff(registry, 1, "django_db_execute_many_batch_size_count", **labels)
+        assert_metric_diff(registry, 1, "django_db_execute_many_batch_size_bucket", le="4.0", **labels)
+        assert_metric_diff(registry, 0, "django_db_execute_many_batch_size_bucket", le="2.0", **labels)
+        assert_metric_diff(registry, 1, "django_db_execute_many_rows_per_second_count", **labels)
+
+    def test_rows(self):
+        registry = save_registry()
+        labels = {"alias": "test_db_1", "vendor": "sqlite"}
+        cursor = connections["test_db_1"].cursor()
+        cursor.executemany(
+            "INSERT INTO testapp_lawn(location) VALUES (%s)",
+            [("Paris",), ("New York",), ("Berlin",), ("San Francisco",)],
+        )
+        cursor.execute("UPDATE testapp_lawn SET location = %s WHERE location = %s", ["Lyon", "Paris"])
+        assert_metric_diff(registry, 2, "django_db_rows_affected_count", **labels)
+        assert_metric_diff(registry, 5, "django_db_rows_affected_sum", **labels)
+
+        cursor.execute("SELECT location FROM testapp_lawn")
+        cursor.fetchone()
+        cursor.fetchmany(2)
+        cursor.fetchall()
+        cursor.execute("SELECT location FROM testapp_lawn")
+        assert len(list(cursor)) == 4
+        # Results that are not fetched count as 0 rows.
+        cursor.execute("SELECT 1")
+        cursor.close()
+        assert_metric_diff(registry, 3, "django_db_rows_fetched_count", **labels)
+        assert_metric_diff(registry, 8, "django_db_rows_fetched_sum", **labels)
+        assert_metric_diff(registry, 1, "django_db_rows_fetched_bucket", le="2.0", **labels)
+        assert_metric_diff(registry, 3, "django_db_rows_fetched_bucket", le="4.0", **labels)
+
+    def test_rows_with_delegating_cursor(self):
+        class DelegatingCursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def execute(self, query, args=None):
+                return self.cursor.execute(query, args)
+
+            def __getattr__(self, attr):
+                return getattr(self.cursor, attr)
+
+        registry = save_registry()
+        CursorWrapper = common.ExportingCursorWrapper(DelegatingCursor, "delegating", "sqlite")
+        cursor = CursorWrapper(connections["test_db_1"].cursor())
+        cursor.execute("SELECT 1 UNION SELECT 2")
+        assert cursor.fetchall() == [(1,), (2,)]
+        cursor.close()
+        assert_metric_diff(registry, 2, "django_db_rows_fetched_sum", alias="delegating", vendor="sqlite")
+
+    def test_rows_unknown_rowcount(self):
+        class Cursor:
+            """A DB-API cursor whose driver doesn't report rowcounts."""
+
+            description = None
+            rowcount = None
+
+            def execute(self, query, args=None):
+                pass
+
+        registry = save_registry()
+        cursor = common.ExportingCursorWrapper(Cursor, "unknown_rowcount", "sqlite")()
+        cursor.execute("UPDATE t SET x = 1")
+        assert_metric_diff(registry, 1, "django_db_execute_total", alias="unknown_rowcount", vendor="sqlite")
+        assert_metric_diff(registry, 0, "django_db_rows_affected_count", alias="unknown_rowcount", vendor="sqlite")
+
+    def test_async_cursor(self):
+        class AsyncCursor:
+            """Mimics psycopg's AsyncCursor over a sqlite3 cursor."""
+
+            def __init__(self, cursor):
+                self.cursor = cursor
+                self.description = None
+                self.rowcount = -1
+
+            async def execute(self, query, params=()):
+                self.cursor.execute(query, params)
+                self.description, self.rowcount = self.cursor.description, self.cursor.rowcount
+                return self
+
+            async def executemany(self, query, params_seq):
+                self.cursor.executemany(query, params_seq)
+                self.description, self.rowcount = self.cursor.description, self.cursor.rowcount
+
+            async def fetchone(self):
+                return self.cursor.fetchone()
+
+            async def fetchmany(self, size=1):
+                return self.cursor.fetchmany(size)
+
+            async def fetchall(self):
+                return self.cursor.fetchall()
+
+            async def close(self):
+                self.cursor.close()
+
+            async def __aiter__(self):
+                for row in self.cursor:
+                    yield row
+
+        registry = save_registry()
+        labels = {"alias": "async", "vendor": "sqlite"}
+        CursorWrapper = common.ExportingAsyncCursorWrapper(AsyncCursor, "async", "sqlite")
+        assert CursorWrapper is common.ExportingAsyncCursorWrapper(AsyncCursor, "async", "sqlite")
+        cursor = CursorWrapper(sqlite3.connect(":memory:", check_same_thread=False).cursor())
+
+        async def queries():
+            await cursor.execute("CREATE TABLE t (x INTEGER)")
+            await cursor.executemany("INSERT INTO t VALUES (?)", iter([(1,), (2,), (3,)]))
+            await cursor.execute("SELECT x FROM t ORDER BY x")
+            assert await cursor.fetchone() == (1,)
+            assert await cursor.fetchall() == [(2,), (3,)]
+            await cursor.execute("SELECT x FROM t ORDER BY x")
+            assert [row async for row in cursor] == [(1,), (2,), (3,)]
+            with pytest.raises(sqlite3.OperationalError):
+                await cursor.execute("this is clearly not valid SQL")
+            await cursor.close()
+
+        async_to_sync(queries)()
+        assert_metric_diff(registry, 7, "django_db_execute_total", **labels)
+        assert_metric_diff(registry, 3, "django_db_execute_many_total", **labels)
+        assert_metric_diff(registry, 1, "django_db_errors_total", type="OperationalError", **labels)
+        assert_metric_diff(registry, 5, "django_db_query_duration_seconds_count", **labels)
+        assert_metric_diff(registry, 3, "django_db_rows_affected_sum", **labels)
+        assert_metric_diff(registry, 6, "django_db_rows_fetched_sum", **labels)
+
+    def test_async_orm(self):
+        registry = save_registry()
+        assert async_to_sync(Lawn.objects.using("test_db_1").acount)() == 0
+        assert_metric_diff(registry, 1, "django_db_execute_total", alias="test_db_1", vendor="sqlite")
+        assert_metric_diff(registry, 1, "django_db_rows_fetched_count", alias="test_db_1", vendor="sqlite")
+
+    def test_wrapped_engine(self):
+        registry = save_registry()
+        labels = {"alias": "test_db_wrapped", "vendor": "sqlite"}
+        connection = connections["test_db_wrapped"]
+        assert type(connection) is wrapped.InstrumentedDatabaseWrapper("django.db.backends.sqlite3")
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 UNION SELECT 2")
+        assert cursor.fetchall() == [(1,), (2,)]
+        cursor.execute("SELECT 3")
+        assert list(cursor) == [(3,)]
+        with pytest.raises(OperationalError):
+            cursor.execute("this is clearly not valid SQL")
+        cursor.close()
+        assert_metric_diff(registry, 3, "django_db_execute_total", **labels)
+        assert_metric_diff(registry, 1, "django_db_errors_total", type="OperationalError", **labels)
+        assert_metric_diff(registry, 3, "django_db_query_duration_seconds_count", **labels)
+        assert_metric_diff(registry, 3, "django_db_rows_fetched_sum", **labels)
+
+    def test_wrapped_engine_configuration(self):
+        from django_prometheus.db.backends.sqlite3.base import DatabaseWrapper
+
+        assert wrapped.InstrumentedDatabaseWrapper("django_prometheus.db.backends.sqlite3") is DatabaseWrapper
+        with pytest.raises(ImproperlyConfigured):
+            wrapped.DatabaseWrapper({"OPTIONS": {}}, "missing")
+        with pytest.raises(ImproperlyConfigured):
+            wrapped.InstrumentedDatabaseWrapper("django_prometheus.db.backends.wrapped")
+
+    def test_cursor_wrapper_classes_are_reused(self):
+        cursor_class = type(connections["test_db_1"].cursor().cursor)
+        assert cursor_class is type(connections["test_db_1"].cursor().cursor)
+        assert cursor_class is not type(connections["test_db_2"].cursor().cursor)
+
+    def test_connection_lifetime(self):
+        registry = save_registry()
+        labels = {"alias": "test_db_1", "vendor": "sqlite"}
+        wrapper = connections.create_connection("test_db_1")
+        with wrapper.cursor() as cursor:
+            for _ in range(3):
+                cursor.execute("SELECT 1")
+        assert wrapper.is_usable()
+        # close() keeps in-memory SQLite databases open.
+        wrapper._close()
+        assert_metric_diff(registry, 1, "django_db_connection_age_seconds_count", **labels)
+        assert_metric_diff(registry, 0, "django_db_connection_queries_bucket", le="2.0", **labels)
+        assert_metric_diff(registry, 1, "django_db_connection_queries_bucket", le="4.0", **labels)
+        assert_metric_diff(registry, 1, "django_db_health_check_seconds_count", **labels)
+
+    def test_transactions(self):
+        registry = save_registry()
+        labels = {"alias": "test_db_1", "vendor": "sqlite"}
+        wrapper = connections.create_connection("test_db_1")
+        wrapper.set_autocommit(False)
+        wrapper.commit()
+        wrapper.rollback()
+        wrapper.set_autocommit(True)
+        # Commits in autocommit mode don't end any transaction.
+        wrapper.commit()
+        wrapper._close()
+        # The test runs in a transaction, so this creates a savepoint.
+        with transaction.atomic(using="test_db_1"):
+            pass
+        assert_metric_diff(registry, 1, "django_db_commits_total", **labels)
+        assert_metric_diff(registry, 1, "django_db_rollbacks_total", **labels)
+        assert_metric_diff(registry, 1, "django_db_savepoints_total", **labels)
+        assert_metric_diff(registry, 2, "django_db_transaction_duration_seconds_count", **labels)
+
+    def test_connection_pool(self, monkeypatch):
+        class FakePool:
+            closed = False
+
+            def get_stats(self):
+                return {"pool_size": 4, "pool_available": 1, "requests_waiting": 2}
+
+        registry = save_registry()
+        pools = metrics.ConnectionPools(registry=None)
+        monkeypatch.setattr(common, "connection_pools", pools)
+        wrapper = connections.create_connection("test_db_1")
+        wrapper.pool = FakePool()
+        wrapper.ensure_connection()
+        # close() keeps in-memory SQLite databases open.
+        wrapper._close()
+        labels = {"alias": "test_db_1", "vendor": "sqlite"}
+        assert_metric_diff(registry, 1, "django_db_pool_checkout_seconds_count", **labels)
+        assert_metric_diff(registry, 1, "django_db_pool_connection_hold_seconds_count", **labels)
+
+        samples = {s.name: s.value for family in pools.collect() for s in family.samples if s.labels == labels}
+        assert samples == {
+            "django_db_pool_size": 4,
+            "django_db_pool_idle_connections": 1,
+            "django_db_pool_in_use_connections": 3,
+            "django_db_pool_requests_waiting": 2,
+        }
+        wrapper.pool.closed = True
+        assert all(not family.samples for family in pools.collect())
+
+    def test_pooled_connections_are_wrapped_once(self, monkeypatch):
+        psycopg = pytest.importorskip("psycopg")
+        from django.db.backends.postgresql import base as postgresql
+
+        from django_prometheus.db.backends.postgresql.base import DatabaseWrapper
+
+        class FakeConnection:
+            cursor_factory = psycopg.Cursor
+
+        # A pool hands out the same connection on every checkout.
+        pooled = FakeConnection()
+        monkeypatch.setattr(postgresql.DatabaseWrapper, "get_new_connection", lambda self, params: pooled)
+        wrapper = DatabaseWrapper(settings.DATABASES["test_db_1"], alias="test_db_1")
+        for _ in range(2):
+            assert wrapper.get_new_connection({}) is pooled
+            assert pooled.cursor_factory is common.ExportingCursorWrapper(psycopg.Cursor, wrapper.alias, "postgresql")
+
+    def test_server_side_cursors(self, monkeypatch):
+        pytest.importorskip("psycopg")
+        from django.db.backends.postgresql import base as postgresql
+
+        from django_prometheus.db.backends.postgresql.base import DatabaseWrapper
+
+        # Like psycopg's ServerCursor, which isn't wrapped.
+        class ServerCursor:
+            __slots__ = ("name",)
+
+        monkeypatch.setattr(postgresql.DatabaseWrapper, "create_cursor", lambda self, name=None: ServerCursor())
+        wrapper = DatabaseWrapper(settings.DATABASES["test_db_1"], alias="test_db_1")
+        assert isinstance(wrapper.create_cursor("server_side"), ServerCursor)
+
+    def test_top_queries(self, monkeypatch):
+        top_queries = metrics.TopQueries(2, registry=None)
+        monkeypatch.setattr(metrics, "top_queries", top_queries)
+        cursor = connections["test_db_1"].cursor()
+        for i in range(3):
+            cursor.execute(f"SELECT {i}")
+        cursor.execute("SELECT 'x' WHERE 1 = %s", [1])
+        executions, duration = top_queries.collect()
+        assert [(s.name, s.labels["fingerprint"], s.value) for s in executions.samples] == [
+            ("django_db_top_query_executions_total", "SELECT ?", 3),
+            ("django_db_top_query_executions_total", "SELECT ? WHERE ? = ?", 1),
+        ]
+        assert executions.samples[0].labels["alias"] == "test_db_1"
+        assert duration.samples[0].name == "django_db_top_query_duration_seconds_total"
+        assert duration.samples[0].value > 0
+
+        # A fingerprint that replaces another one only counts its own
+        # executions, like its duration.
+        cursor.execute("SELECT 1 WHERE 2 = 2 AND 3 = 3 AND 4 = 4")
+        executions, _ = top_queries.collect()
+        assert [(s.labels["fingerprint"], s.value) for s in executions.samples] == [
+            ("SELECT ?", 3),
+            ("SELECT ? WHERE ? = ? AND ? = ? AND ? = ?", 1),
+        ]
+
+    def test_top_queries_label_length(self, monkeypatch):
+        top_queries = metrics.TopQueries(2, label_length=40, registry=None)
+        monkeypatch.setattr(metrics, "top_queries", top_queries)
+        cursor = connections["test_db_1"].cursor()
+        cursor.execute("SELECT 1 WHERE 2 = 2 AND 3 = 3 AND 4 = 4")
+        executions, _ = top_queries.collect()
+        fingerprint = executions.samples[0].labels["fingerprint"]
+        assert len(fingerprint) == 40
+        assert fingerprint.startswith("SELECT ? WHERE")
+
+    def test_slow_queries(self, client, admin_client, monkeypatch):
+        assert admin_client.get("/metrics/slow_queries").status_code == 404
+        monkeypatch.setattr(slow_queries, "slow_query_log", slow_queries.SlowQueryLog(0, size=2))
+        for i in range(3):
+            client.get("/sql", {"query": f"SELECT {i}", "database": "test_db_1"})
+        connections["test_db_1"].cursor().execute("SELECT 'x'")
+        entries = slow_queries.slow_query_log.entries()
+        assert [(e["alias"], e["view"], e["fingerprint"]) for e in entries] == [
+            ("test_db_1", "testapp.views.sql", "SELECT ?"),
+            ("test_db_1", None, "SELECT ?"),
+        ]
+
+        assert client.get("/metrics/slow_queries").status_code == 403
+        response = admin_client.get("/metrics/slow_queries")
+        assert response.status_code == 200
+        assert response.json()["threshold"] == 0
+        assert len(response.json()["queries"]) == 2
+
+    def test_request_histograms(self, client, async_client):
+        registry = save_registry()
+        view = "testapp.views.sql"
+        client.get("/sql")
+        client.get("/sql", {"query": "SELECT 1", "database": "test_db_1"})
+        # Synchronous views run in another thread under ASGI.
+        async_to_sync(async_client.get)("/sql", {"query": "SELECT 1", "database": "test_db_1"})
+        assert_metric_diff(registry, 3, "django_http_request_db_queries_count", view=view)
+        assert_metric_diff(registry, 1, "django_http_request_db_queries_bucket", le="0.0", view=view)
+        assert_metric_diff(registry, 3, "django_http_request_db_queries_bucket", le="1.0", view=view)
+        assert_metric_diff(registry, 3, "django_http_request_db_seconds_count", view=view)
+        assert_metric_compare(registry, lambda a, b: (a or 0) < b, "django_http_request_db_seconds_sum", view=view)
+        # Queries outside of requests are not attributed to any request.
+        connections["test_db_1"].cursor().execute("SELECT 1")
+        assert_metric_diff(registry, 3, "django_http_request_db_queries_count", view=view)
+
 
 @pytest.mark.skipif("postgresql" not in connections, reason="Skipped unless postgresql database is enabled")
 class TestPostgresDbMetrics(BaseDBTest):
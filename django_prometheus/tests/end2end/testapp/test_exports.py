@@ -0,0 +1,101 @@
+import gzip
+import socket
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+from django_prometheus.exports import PrometheusEndpointHTTPServer
+
+
+@pytest.fixture
+def exporter():
+    httpd = PrometheusEndpointHTTPServer(("127.0.0.1", 0), max_connections=1, timeout=2)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestExportToDjangoView:
+    def test_metrics_page(self, client):
+        client.get("/")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain")
+        assert b"django_http_requests_before_middlewares_total" in response.content
+
+    def test_payload_cache(self, client, settings):
+        settings.PROMETHEUS_EXPORT_CACHE_TTL = 60
+        first = client.get("/metrics").content
+        client.get("/")
+        assert client.get("/metrics").content == first
+        settings.PROMETHEUS_EXPORT_CACHE_TTL = 0
+        assert client.get("/metrics").content != first
+
+    def test_openmetrics(self, client):
+        response = client.get("/metrics", headers={"Accept": "application/openmetrics-text"})
+        assert response["Content-Type"].startswith("application/openmetrics-text")
+        assert response.content.endswith(b"# EOF\n")
+        assert "Accept" in response["Vary"]
+
+    def test_name_filter(self, client):
+        client.get("/")
+        response = client.get(
+            "/metrics",
+            {
+                "name[]": [
+                    "django_http_requests_before_middlewares_total",
+                    "django_http_responses_before_middlewares_total",
+                ]
+            },
+        )
+        samples = [line for line in response.content.decode().splitlines() if not line.startswith("#")]
+        assert {line.split(" ")[0] for line in samples} == {
+            "django_http_requests_before_middlewares_total",
+            "django_http_responses_before_middlewares_total",
+        }
+
+    def test_gzip(self, client, settings):
+        response = client.get("/metrics", headers={"Accept-Encoding": "gzip, deflate"})
+        assert response["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response["Vary"]
+        assert b"django_http_requests_before_middlewares_total" in gzip.decompress(response.content)
+
+        response = client.get("/metrics", headers={"Accept-Encoding": "x-gzip, deflate"})
+        assert not response.has_header("Content-Encoding")
+
+        settings.PROMETHEUS_EXPORT_GZIP_MIN_SIZE = None
+        response = client.get("/metrics", headers={"Accept-Encoding": "gzip"})
+        assert not response.has_header("Content-Encoding")
+
+        settings.PROMETHEUS_EXPORT_GZIP_MIN_SIZE = 100 * 1024 * 1024
+        response = client.get("/metrics", headers={"Accept-Encoding": "gzip"})
+        assert not response.has_header("Content-Encoding")
+
+
+class TestPrometheusEndpointHTTPServer:
+    def test_keep_alive(self, exporter):
+        connection = HTTPConnection(*exporter.server_address, timeout=2)
+        for _ in range(2):
+            connection.request("GET", "/metrics")
+            response = connection.getresponse()
+            body = response.read()
+            assert response.status == 200
+            assert int(response.getheader("Content-Length")) == len(body)
+            assert b"django_metrics_export_in_flight 1.0" in body
+        connection.request("GET", "/metrics?name[]=django_metrics_export_in_flight")
+        body = connection.getresponse().read()
+        assert [line for line in body.splitlines() if not line.startswith(b"#")] == [
+            b"django_metrics_export_in_flight 1.0",
+        ]
+        connection.close()
+
+    def test_max_connections(self, exporter):
+        idle = socket.create_connection(exporter.server_address)
+        extra = HTTPConnection(*exporter.server_address, timeout=2)
+        with pytest.raises(OSError):
+            extra.request("GET", "/metrics")
+            extra.getresponse()
+        idle.close()
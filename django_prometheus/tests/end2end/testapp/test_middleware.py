@@ -1,5 +1,8 @@
 import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from prometheus_client import Counter
 
+from django_prometheus.middleware import ClearLabelCaches, PrometheusAfterMiddleware
 from django_prometheus.testutils import (
     assert_metric_diff,
     assert_metric_equal,
@@ -137,3 +140,54 @@ class TestMiddlewareMetrics:
         client.get("/file")
         assert_metric_diff(registry, 1, M("responses_streaming_total"))
         assert_metric_diff(registry, 1, M("responses_body_total_bytes_bucket"), le="+Inf")
+
+    def test_label_cache(self):
+        middleware = PrometheusAfterMiddleware(lambda request: None)
+        middleware.label_cache_size = 2
+        metric = middleware.metrics.responses_by_status
+        child = middleware.label_metric(metric, None, status="200")
+        assert middleware.label_metric(metric, None, status="200") is child
+        assert middleware.label_metric(metric, None) is metric
+        middleware.label_metric(metric, None, status="404")
+        middleware.label_metric(metric, None, status="500")
+        assert len(middleware._label_cache) <= 2
+
+        # Label values are converted to strings, like metric.labels() does.
+        assert middleware.label_metric(metric, None, status=["unhashable"]) is metric.labels(status="['unhashable']")
+        assert middleware.label_metric(metric, None, status=500) is middleware.label_metric(metric, None, status="500")
+
+        # Removed children are not updated anymore once caches are cleared.
+        metric = Counter("label_cache", "Label cache.", ["status"], registry=None)
+        child = middleware.label_metric(metric, None, status="500")
+        metric.remove("500")
+        ClearLabelCaches()
+        assert middleware.label_metric(metric, None, status="500") is not child
+        assert middleware.label_metric(metric, None, status="500") is metric.labels(status="500")
+
+    def test_async_requests(self, async_client):
+        registry = save_registry()
+        async_to_sync(async_client.get)("/")
+        async_to_sync(async_client.get)("/help")
+
+        assert_metric_diff(registry, 2, M("requests_before_middlewares_total"))
+        assert_metric_diff(registry, 2, T("requests_total_by_method"), method="GET")
+        assert_metric_diff(
+            registry,
+            1,
+            T("requests_total_by_view_transport_method"),
+            view="testapp.views.index",
+            transport="http",
+            method="GET",
+        )
+        assert_metric_diff(registry, 1, T("responses_total_by_templatename"), templatename="index.html")
+        assert_metric_diff(registry, 2, T("responses_total_by_status"), status="200")
+
+    def test_async_hooks_run_on_event_loop(self):
+        async def get_response(request):
+            pass
+
+        middleware = PrometheusAfterMiddleware(get_response)
+        assert iscoroutinefunction(middleware)
+        assert iscoroutinefunction(middleware.process_view)
+        assert iscoroutinefunction(middleware.process_template_response)
+        assert not iscoroutinefunction(middleware.process_exception)
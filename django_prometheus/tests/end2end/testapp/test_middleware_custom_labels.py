@@ -7,6 +7,7 @@ from django_prometheus.middleware import (
     PrometheusAfterMiddleware,
     PrometheusBeforeMiddleware,
 )
+from django_prometheus.shards import ShardedMetric
 from django_prometheus.testutils import assert_metric_diff, save_registry
 from testapp.helpers import get_middleware
 from testapp.test_middleware import M, T
@@ -48,7 +49,7 @@ class TestMiddlewareMetricsWithCustomLabels:
         )
         # Allow CustomMetrics to be used
         for metric in Metrics._instance.__dict__.values():
-            if isinstance(metric, MetricWrapperBase):
+            if isinstance(metric, (MetricWrapperBase, ShardedMetric)):
                 REGISTRY.unregister(metric)
         Metrics._instance = None
 
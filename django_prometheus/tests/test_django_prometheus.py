@@ -1,4 +1,9 @@
 #!/usr/bin/env python
+import subprocess
+import sys
+
+import pytest
+
 from django_prometheus.utils import PowersOf
 
 
@@ -9,3 +14,18 @@ class TestDjangoPrometheus:
         assert PowersOf(3, 5, lower=1) == [0, 3, 9, 27, 81, 243]
         assert PowersOf(2, 4, include_zero=False) == [1, 2, 4, 8]
         assert PowersOf(2, 6, lower=2, include_zero=False) == [4, 8, 16, 32, 64, 128]
+
+    @pytest.mark.parametrize("module", ["django_prometheus.middleware", "django_prometheus.urls"])
+    def testDoesNotRegisterDatabaseMetrics(self, module):
+        """The middleware and the URLs can be used without the database
+        backends."""
+        code = (
+            "import sys\n"
+            "from django.conf import settings\n"
+            "settings.configure()\n"
+            f"import {module}\n"
+            "from prometheus_client import REGISTRY\n"
+            "assert not [m for m in sys.modules if m.startswith('django_prometheus.db')]\n"
+            "assert not [m.name for m in REGISTRY.collect() if m.name.startswith('django_db_')]\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
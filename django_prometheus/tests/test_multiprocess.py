@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+import os
+import subprocess
+import sys
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, values
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from django_prometheus.multiprocess import (
+    CompactMultiProcessFiles,
+    IncrementalMultiProcessCollector,
+    MultiProcessRegistry,
+)
+
+
+@pytest.fixture
+def multiproc_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(values, "ValueClass", values.ValueClass)
+    return tmp_path
+
+
+def worker_metrics(pid):
+    """Returns metrics that write to the files of process pid."""
+    values.ValueClass = values.MultiProcessValue(process_identifier=lambda: pid)
+    return (
+        Counter("requests_total", "Requests.", ["view"], registry=None),
+        Histogram("latency_seconds", "Latency.", buckets=(1, 2), registry=None),
+        Gauge("connections", "Connections.", multiprocess_mode="livesum", registry=None),
+    )
+
+
+def samples(collector):
+    return sorted((s.name, sorted(s.labels.items()), s.value) for m in collector.collect() for s in m.samples)
+
+
+class TestIncrementalMultiProcessCollector:
+    def testMatchesMultiProcessCollector(self, multiproc_dir):
+        reference = MultiProcessCollector(None)
+        collector = IncrementalMultiProcessCollector(None)
+        assert samples(collector) == []
+
+        counter, histogram, gauge = worker_metrics("1")
+        counter.labels("index").inc()
+        histogram.observe(1.5)
+        gauge.set(2)
+        assert samples(collector) == samples(reference)
+
+        counter.labels("index").inc()
+        counter.labels("help").inc(3)
+        assert samples(collector) == samples(reference)
+
+        counter, histogram, gauge = worker_metrics("2")
+        counter.labels("index").inc()
+        histogram.observe(0.5)
+        gauge.set(3)
+        assert samples(collector) == samples(reference)
+        assert ("requests_total", [("view", "index")], 3.0) in samples(collector)
+
+        (multiproc_dir / "gauge_livesum_2.db").unlink()
+        assert samples(collector) == samples(reference)
+        assert ("connections", [], 2.0) in samples(collector)
+
+    def testOnlyChangedFilesAreParsed(self, multiproc_dir, monkeypatch):
+        collector = IncrementalMultiProcessCollector(None)
+        for pid in ("1", "2"):
+            counter, histogram, _ = worker_metrics(pid)
+            counter.labels("index").inc()
+            histogram.observe(1)
+        collector.collect()
+
+        parsed = []
+        read_metrics = MultiProcessCollector._read_metrics
+        monkeypatch.setattr(
+            MultiProcessCollector,
+            "_read_metrics",
+            staticmethod(lambda files: parsed.extend(files) or read_metrics(files)),
+        )
+        counter.labels("index").inc()
+        assert ("requests_total", [("view", "index")], 3.0) in samples(collector)
+        assert [f.rsplit("/", 1)[-1] for f in parsed] == ["counter_2.db"]
+
+    def testRegistry(self, multiproc_dir):
+        registry = CollectorRegistry()
+        IncrementalMultiProcessCollector(registry)
+        counter, _, _ = worker_metrics("1")
+        counter.labels("index").inc()
+        assert registry.get_sample_value("requests_total", {"view": "index"}) == 1
+
+    def testOnlyRequestedMetricsAreMerged(self, multiproc_dir, monkeypatch):
+        registry = MultiProcessRegistry()
+        counter, histogram, _ = worker_metrics("1")
+        counter.labels("index").inc()
+        histogram.observe(1)
+
+        merged = []
+        merge = IncrementalMultiProcessCollector._merge
+        monkeypatch.setattr(
+            IncrementalMultiProcessCollector,
+            "_merge",
+            lambda self, name: merged.append(name) or merge(self, name),
+        )
+        restricted = registry.restricted_registry(["requests_total"])
+        assert samples(restricted) == [("requests_total", [("view", "index")], 1.0)]
+        assert merged == ["requests"]
+
+        counter.labels("index").inc()
+        restricted = registry.restricted_registry(["latency_seconds_count", "latency_seconds_sum"])
+        assert samples(restricted) == [("latency_seconds_count", [], 1.0), ("latency_seconds_sum", [], 1.0)]
+        assert merged == ["requests", "latency_seconds"]
+        assert registry.get_sample_value("requests_total", {"view": "index"}) == 2
+
+
+class TestCompactMultiProcessFiles:
+    def testCompaction(self, multiproc_dir):
+        reference = MultiProcessCollector(None)
+        collector = IncrementalMultiProcessCollector(None)
+        for pid in ("1001", "1002", "1003"):
+            counter, histogram, gauge = worker_metrics(pid)
+            counter.labels("index").inc(int(pid) - 1000)
+            histogram.observe(1.5)
+            gauge.set(1)
+        before = samples(reference)
+        assert samples(collector) == before
+
+        assert CompactMultiProcessFiles(pids=[1001, 1002]) == ["1001", "1002"]
+        assert sorted(f.name for f in multiproc_dir.glob("*.db")) == [
+            "counter_1003.db",
+            "counter_archive.db",
+            "gauge_livesum_1003.db",
+            "histogram_1003.db",
+            "histogram_archive.db",
+        ]
+        live_gauge = ("connections", [], 1.0)
+        assert samples(reference) == [s if s[0] != "connections" else live_gauge for s in before]
+        assert samples(collector) == samples(reference)
+
+        # The archive keeps growing when more processes are compacted.
+        counter, _, _ = worker_metrics("1004")
+        counter.labels("index").inc(10)
+        assert CompactMultiProcessFiles(pids=["1004"]) == ["1004"]
+        assert ("requests_total", [("view", "index")], 16.0) in samples(reference)
+        assert ("latency_seconds_bucket", [("le", "2.0")], 3.0) in samples(reference)
+        assert samples(collector) == samples(reference)
+
+    def testCompactionOfDeadProcesses(self, multiproc_dir):
+        reference = MultiProcessCollector(None)
+        worker_metrics(str(os.getpid()))[0].labels("index").inc()
+        worker_metrics("999999999")[0].labels("index").inc()
+        assert CompactMultiProcessFiles() == ["999999999"]
+        assert (multiproc_dir / f"counter_{os.getpid()}.db").exists()
+        assert ("requests_total", [("view", "index")], 2.0) in samples(reference)
+
+    def testInterruptedCompaction(self, multiproc_dir, monkeypatch):
+        reference = MultiProcessCollector(None)
+        collector = IncrementalMultiProcessCollector(None)
+        for pid in ("1001", "1002"):
+            worker_metrics(pid)[0].labels("index").inc()
+        assert samples(collector) == samples(reference)
+
+        # The compaction stops after the archive is replaced, but before it
+        # removes the files it merged.
+        def interrupt(filename):
+            raise OSError
+
+        with monkeypatch.context() as m:
+            m.setattr(os, "remove", interrupt)
+            with pytest.raises(OSError):
+                CompactMultiProcessFiles(pids=["1001"])
+        assert (multiproc_dir / "counter_1001.db").exists()
+        assert ("requests_total", [("view", "index")], 2.0) in samples(collector)
+
+        # The next compaction doesn't merge the file again.
+        assert CompactMultiProcessFiles(pids=["1001"]) == ["1001"]
+        assert not (multiproc_dir / "counter_1001.db").exists()
+        assert ("requests_total", [("view", "index")], 2.0) in samples(reference)
+        assert samples(collector) == samples(reference)
+
+        # Identifiers of compacted processes can be reused.
+        worker_metrics("1001")[0].labels("index").inc()
+        assert ("requests_total", [("view", "index")], 3.0) in samples(collector)
+
+    def testNoFilesLeftByTheExporters(self, multiproc_dir):
+        code = "from django.conf import settings\nsettings.configure()\nimport django_prometheus.exports\n"
+        process = subprocess.Popen([sys.executable, "-c", code])
+        assert process.wait() == 0
+        assert CompactMultiProcessFiles(pids=[process.pid]) == [str(process.pid)]
+        assert sorted(f.name for f in multiproc_dir.glob("*.db")) == ["histogram_archive.db"]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+import threading
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from django_prometheus.shards import ShardedCounter, ShardedHistogram, ShardedMetric
+
+
+def run_in_threads(func, count=4):
+    threads = [threading.Thread(target=func) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestShardedMetrics:
+    def testCounter(self):
+        registry = CollectorRegistry()
+        counter = ShardedCounter("requests_total", "Requests.", ["method"], registry=registry)
+        counter.labels("POST")
+
+        def work():
+            for _ in range(1000):
+                counter.labels(method="GET").inc()
+
+        run_in_threads(work)
+        counter.labels("GET").inc(2)
+        assert registry.get_sample_value("requests_total", {"method": "GET"}) == 4002
+        assert registry.get_sample_value("requests_total", {"method": "POST"}) == 0
+        # Shards of exited threads are kept.
+        assert registry.get_sample_value("requests_total", {"method": "GET"}) == 4002
+
+    def testCollectionsDuringUpdates(self):
+        registry = CollectorRegistry()
+        counter = ShardedCounter("requests_total", "Requests.", ["view"], registry=registry)
+        done = threading.Event()
+
+        def collect():
+            while not done.is_set():
+                registry.get_sample_value("requests_total", {"view": "0"})
+
+        collector = threading.Thread(target=collect)
+        collector.start()
+        try:
+
+            def work():
+                for i in range(10000):
+                    counter.labels(view=str(i % 100)).inc()
+
+            run_in_threads(work)
+        finally:
+            done.set()
+            collector.join()
+        assert sum(registry.get_sample_value("requests_total", {"view": str(i)}) for i in range(100)) == 40000
+
+    def testUnlabelledCounter(self):
+        registry = CollectorRegistry()
+        counter = ShardedCounter("events", "Events.", namespace="app", registry=registry)
+        assert registry.get_sample_value("app_events_total") == 0
+        counter.inc()
+        counter.inc(0.5)
+        assert registry.get_sample_value("app_events_total") == 1.5
+        with pytest.raises(ValueError):
+            counter.inc(-1)
+
+    def testLabelValidation(self):
+        counter = ShardedCounter("errors_total", "Errors.", ["alias", "type"], registry=None)
+        with pytest.raises(ValueError):
+            counter.labels("default")
+        with pytest.raises(ValueError):
+            counter.labels(alias="default")
+        with pytest.raises(ValueError):
+            counter.labels("default", type="OperationalError")
+        assert counter.labels("default", "E") is counter.labels(alias="default", type="E")
+
+    def testHistogram(self):
+        registry = CollectorRegistry()
+        histogram = ShardedHistogram("latency_seconds", "Latency.", ["view"], buckets=(1, 2), registry=registry)
+
+        def work():
+            child = histogram.labels("index")
+            child.observe(0.5)
+            child.observe(1)
+            child.observe(3)
+
+        run_in_threads(work)
+        with histogram.labels("index").time():
+            pass
+
+        labels = {"view": "index"}
+        assert registry.get_sample_value("latency_seconds_bucket", {"le": "1.0", **labels}) == 9
+        assert registry.get_sample_value("latency_seconds_bucket", {"le": "2.0", **labels}) == 9
+        assert registry.get_sample_value("latency_seconds_bucket", {"le": "+Inf", **labels}) == 13
+        assert registry.get_sample_value("latency_seconds_count", labels) == 13
+        assert 18 <= registry.get_sample_value("latency_seconds_sum", labels) < 18.5
+
+    def testCreatedSamples(self):
+        registry = CollectorRegistry()
+        counter = ShardedCounter("requests_total", "Requests.", ["method"], registry=registry)
+        histogram = ShardedHistogram("latency_seconds", "Latency.", buckets=(1, 2), registry=registry)
+        counter.labels("GET").inc()
+        histogram.observe(1)
+        assert registry.get_sample_value("requests_created", {"method": "GET"}) > 0
+        assert registry.get_sample_value("latency_seconds_created") > 0
+
+    def testBaseClassIsAbstract(self):
+        with pytest.raises(TypeError):
+            ShardedMetric("events", "Events.", registry=None)
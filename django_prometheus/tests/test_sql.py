@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import pytest
+
+from django_prometheus.db.sql import Fingerprint, StatementType
+
+
+class TestFingerprint:
+    @pytest.mark.parametrize(
+        ("sql", "fingerprint"),
+        [
+            ("SELECT 1", "SELECT ?"),
+            ('SELECT "t1"."id" FROM "t1" WHERE "t1"."id" = %s', 'SELECT "t1"."id" FROM "t1" WHERE "t1"."id" = ?'),
+            ("SELECT * FROM t WHERE name = 'O''Brien' AND x > -1.5e3", "SELECT * FROM t WHERE name = ? AND x > ?"),
+            ("SELECT * FROM t WHERE id IN (1, 2, 3)", "SELECT * FROM t WHERE id IN (...)"),
+            ("SELECT * FROM t WHERE id IN (%s,%s)", "SELECT * FROM t WHERE id IN (...)"),
+            ("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)", "INSERT INTO t (a, b) VALUES (...)"),
+            ("SELECT a::int FROM t WHERE b = $1", "SELECT a::int FROM t WHERE b = ?"),
+            ("SELECT  *\n  FROM t -- comment\n /* hint */ LIMIT 10", "SELECT * FROM t LIMIT ?"),
+            (b"SELECT 2", "SELECT ?"),
+            (object(), "<object>"),
+        ],
+    )
+    def testFingerprint(self, sql, fingerprint):
+        assert Fingerprint(sql) == fingerprint
+
+
+class TestStatementType:
+    @pytest.mark.parametrize(
+        ("sql", "statement"),
+        [
+            ('SELECT "t"."id" FROM "t"', "SELECT"),
+            ("  (select 1) UNION (select 2)", "SELECT"),
+            ("/* hint */ INSERT INTO t VALUES (1)", "INSERT"),
+            ("update t set a = 1", "UPDATE"),
+            ("DELETE FROM t", "DELETE"),
+            ("WITH x AS (SELECT 1) SELECT * FROM x", "SELECT"),
+            ("WITH x AS (SELECT 1) DELETE FROM t WHERE id IN (SELECT * FROM x)", "DELETE"),
+            ("WITH x AS (SELECT 1) SELECT * FROM x FOR UPDATE", "SELECT"),
+            ('WITH x AS (SELECT "update", delete FROM t) SELECT * FROM x', "SELECT"),
+            ("with x as (select 1) select 'delete' from x", "SELECT"),
+            ("WITH x AS (DELETE FROM t RETURNING *) SELECT * FROM x", "SELECT"),
+            ("WITH RECURSIVE x (update) AS (SELECT 1 UNION SELECT 2) INSERT INTO t SELECT * FROM x", "INSERT"),
+            ("WITH a AS (SELECT 1), b AS MATERIALIZED (SELECT 2) /* delete */ UPDATE t SET c = 1", "UPDATE"),
+            ("CREATE TABLE t (id integer)", "DDL"),
+            ("ALTER TABLE t ADD COLUMN a integer", "DDL"),
+            ("SAVEPOINT s1", "TRANSACTION"),
+            ("PRAGMA foreign_keys = ON", "OTHER"),
+            ("", "OTHER"),
+            (b"SELECT 1", "SELECT"),
+            (object(), "OTHER"),
+        ],
+    )
+    def testStatementType(self, sql, statement):
+        assert StatementType(sql) == statement
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import random
+from collections import Counter
+
+from django_prometheus.topk import ShortenLabel, SpaceSaving
+
+
+class TestSpaceSaving:
+    def testExactCountsBelowCapacity(self):
+        counter = SpaceSaving(3)
+        for key in "abacab":
+            counter.observe(key, 0.5)
+        assert counter.top() == [("a", 3, 0, 1.5), ("b", 2, 0, 1.0), ("c", 1, 0, 0.5)]
+
+    def testHeavyHittersAreKept(self):
+        counter = SpaceSaving(4)
+        for i in range(1000):
+            counter.observe("hot")
+            counter.observe(f"cold{i}")
+        top = counter.top()
+        assert len(top) == 4
+        key, count, error, _ = top[0]
+        assert key == "hot"
+        assert count - error <= 1000 <= count
+
+    def testReplacedKeyInheritsCount(self):
+        counter = SpaceSaving(1)
+        counter.observe("a", 1)
+        counter.observe("a", 1)
+        counter.observe("b", 2)
+        assert counter.top() == [("b", 3, 2, 2)]
+
+    def testObserveMany(self):
+        counter = SpaceSaving(2)
+        counter.observe_many("abacab")
+        assert counter.top() == [("a", 3, 0, 0), ("b", 3, 2, 0)]
+
+    def testCountBounds(self):
+        counter = SpaceSaving(10)
+        rng = random.Random(0)
+        stream = [int(rng.paretovariate(1)) for _ in range(10000)]
+        counter.observe_many(stream)
+        top = counter.top()
+        assert sum(count for _, count, _, _ in top) == len(stream)
+        true_counts = Counter(stream)
+        for key, count, error, _ in top:
+            assert count - error <= true_counts[key] <= count
+        assert top[0][0] == true_counts.most_common(1)[0][0]
+
+
+def testShortenLabel():
+    assert ShortenLabel("SELECT ?", 20) == "SELECT ?"
+    long_value = "SELECT " + "?, " * 100
+    shortened = ShortenLabel(long_value, 40)
+    assert len(shortened) == 40
+    assert shortened.startswith("SELECT ?, ")
+    assert ShortenLabel(long_value + "?", 40) != shortened
@@ -0,0 +1,91 @@
+"""Bounded tracking of the most frequent keys of a stream.
+
+Labelling a metric by values of unbounded cardinality, like SQL
+statements or cache keys, would create an unbounded number of series.
+SpaceSaving instead keeps approximate counts for a fixed number of
+keys, which are guaranteed to include the most frequent ones.
+"""
+
+import hashlib
+import heapq
+import itertools
+import threading
+
+
+class SpaceSaving:
+    """Approximate counts of the most frequent keys of a stream.
+
+    This implements the Space-Saving algorithm (Metwally et al., 2005).
+    At most capacity keys are tracked. When an untracked key is
+    observed and there is no room left, it replaces the key with the
+    lowest count, and inherits that count. The count of each key thus
+    overestimates its true count by at most its error, and any key
+    observed more than N / capacity times out of N is tracked.
+
+    Each key also accumulates the amounts it was observed with, e.g.
+    durations, from the time it was last started being tracked.
+
+    The key to replace is found with a heap of the tracked keys, whose
+    counts are only brought up to date when they reach its top. Counts
+    never decrease, so a key whose count is up to date at the top has
+    the lowest count, and each observation takes amortized O(log
+    capacity) time.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        # Maps keys to [count, error, total amount].
+        self._counters = {}
+        # (count, sequence number, key), where count may be outdated.
+        # Sequence numbers break ties, as keys may not be comparable.
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def observe(self, key, amount=0):
+        with self._lock:
+            self._observe(key, amount)
+
+    def observe_many(self, keys):
+        """Observes each of keys, taking the lock once."""
+        with self._lock:
+            for key in keys:
+                self._observe(key, 0)
+
+    def _observe(self, key, amount):
+        counter = self._counters.get(key)
+        if counter is None:
+            if len(self._counters) < self.capacity:
+                counter = self._counters[key] = [0, 0, 0]
+                heapq.heappush(self._heap, (0, next(self._sequence), key))
+            else:
+                while True:
+                    count, _, evicted = self._heap[0]
+                    current = self._counters[evicted][0]
+                    if current == count:
+                        break
+                    heapq.heapreplace(self._heap, (current, next(self._sequence), evicted))
+                del self._counters[evicted]
+                heapq.heapreplace(self._heap, (count, next(self._sequence), key))
+                counter = self._counters[key] = [count, count, 0]
+        counter[0] += 1
+        counter[2] += amount
+
+    def top(self):
+        """Returns (key, count, error, total) tuples, most frequent first."""
+        with self._lock:
+            items = [(key, *counter) for key, counter in self._counters.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items
+
+
+def ShortenLabel(value, length):
+    """Returns value, shortened to length characters if it is longer.
+
+    Shortened values end with a digest of the whole value, so that
+    distinct values remain distinct.
+    """
+    if len(value) <= length:
+        return value
+    digest = hashlib.blake2b(value.encode(), digest_size=8).hexdigest()
+    return f"{value[: max(length - len(digest) - 3, 0)]}...{digest}"
@@ -1,5 +1,8 @@
 from django.urls import path
 
-from django_prometheus import exports
+from django_prometheus import exports, slow_queries
 
-urlpatterns = [path("metrics", exports.ExportToDjangoView, name="prometheus-django-metrics")]
+urlpatterns = [
+    path("metrics", exports.ExportToDjangoView, name="prometheus-django-metrics"),
+    path("metrics/slow_queries", slow_queries.SlowQueriesView, name="prometheus-django-slow-queries"),
+]